@@ -0,0 +1,152 @@
+"""Time discover.task_info_to_targets over synthetic tasks.
+
+Compares scanning raw task definitions every loop (the previous
+implementation, reproduced below) with projecting from a
+TaskDefinitionIndex built once per definition.
+
+python benchmark_discover.py [n_tasks]
+"""
+
+import sys
+import time
+
+from discover import (
+    TaskDefinitionIndex,
+    Target,
+    TaskInfo,
+    extract_name,
+    extract_task_version,
+    get_environment_var,
+    task_info_to_targets,
+)
+
+N_DEFINITIONS = 200
+LOOPS = 5
+
+
+def task_definition(i):
+    environment = [
+        {"name": "ENVIRONMENT", "value": "prod"},
+        {"name": "LOG_LEVEL", "value": "info"},
+        {"name": "PROMETHEUS", "value": "true"},
+        {"name": "PROMETHEUS_ENDPOINT", "value": "30s:/metrics,5m:/slow,/other"},
+    ]
+    if i % 3 == 0:
+        environment.append({"name": "PROMETHEUS_PORT", "value": "9100"})
+    if i % 7 == 0:
+        environment.append({"name": "PROMETHEUS_NOLABELS", "value": "true"})
+    return {
+        "taskDefinitionArn": f"arn:aws:ecs:us-east-2:123456789012:task-definition/app-{i}:{i % 9 + 1}",
+        "containerDefinitions": [
+            {"name": "proxy", "environment": [{"name": "PORT", "value": "80"}]},
+            {"name": "app", "environment": environment},
+        ],
+    }
+
+
+def task_info(i, definition):
+    info = TaskInfo(
+        {
+            "taskArn": f"arn:aws:ecs:us-east-2:123456789012:task/prod/{i:032x}",
+            "clusterArn": "arn:aws:ecs:us-east-2:123456789012:cluster/prod",
+            "taskDefinitionArn": definition["taskDefinitionArn"],
+            "containers": [
+                {
+                    "name": name,
+                    "containerArn": f"arn:aws:ecs:us-east-2:123456789012:container/prod/{i:032x}-{name}",
+                    "networkBindings": [{"hostPort": 32768 + i % 1000}],
+                }
+                for name in ("proxy", "app")
+            ],
+        }
+    )
+    info.container_instance = {"ec2InstanceId": f"i-{i % 50:017x}"}
+    info.ec2_instance = {"PrivateIpAddress": f"10.0.{i % 50}.1"}
+    return info
+
+
+def legacy_task_info_to_targets(task_info):
+    if not task_info.valid():
+        return []
+    for container_definition in task_info.task_definition["containerDefinitions"]:
+        environment = container_definition["environment"]
+        prometheus = get_environment_var(environment, "PROMETHEUS")
+        metrics_path = get_environment_var(environment, "PROMETHEUS_ENDPOINT")
+        nolabels = get_environment_var(environment, "PROMETHEUS_NOLABELS")
+        prom_port = get_environment_var(environment, "PROMETHEUS_PORT")
+        if nolabels != "true":
+            nolabels = None
+        containers = filter(
+            lambda c: c["name"] == container_definition["name"],
+            task_info.task["containers"],
+        )
+        if prometheus:
+            for container in containers:
+                ecs_task_name = extract_name(task_info.task["taskDefinitionArn"])
+                if prom_port:
+                    first_port = prom_port
+                else:
+                    first_port = str(container["networkBindings"][0]["hostPort"])
+                if nolabels:
+                    p_instance = ecs_task_name
+                    labels = (None,) * 5
+                else:
+                    p_instance = (
+                        task_info.ec2_instance["PrivateIpAddress"] + ":" + first_port
+                    )
+                    labels = (
+                        extract_name(task_info.task["taskArn"]),
+                        extract_task_version(task_info.task["taskDefinitionArn"]),
+                        extract_name(container["containerArn"]),
+                        extract_name(task_info.task["clusterArn"]),
+                        task_info.container_instance["ec2InstanceId"],
+                    )
+                # Target parses metrics_path, as the job loop used to per target.
+                return [
+                    Target(
+                        task_info.ec2_instance["PrivateIpAddress"],
+                        first_port,
+                        metrics_path,
+                        p_instance,
+                        labels[0],
+                        ecs_task_name,
+                        *labels[1:],
+                    )
+                ]
+    return []
+
+
+def summary(targets):
+    return [vars(t) for t in targets]
+
+
+def run(label, infos, fn):
+    start = time.perf_counter()
+    for _ in range(LOOPS):
+        targets = [t for info in infos for t in fn(info)]
+    elapsed = (time.perf_counter() - start) / LOOPS
+    print(f"{label:<10} {elapsed * 1000:8.2f}ms/loop {len(targets)} targets")
+    return targets, elapsed
+
+
+def main(n):
+    definitions = [task_definition(i) for i in range(N_DEFINITIONS)]
+    start = time.perf_counter()
+    indexes = [TaskDefinitionIndex(d) for d in definitions]
+    print(f"indexed {N_DEFINITIONS} definitions in {time.perf_counter() - start:.4f}s")
+
+    raw = [task_info(i, definitions[i % N_DEFINITIONS]) for i in range(n)]
+    indexed = [task_info(i, definitions[i % N_DEFINITIONS]) for i in range(n)]
+    for i, (r, x) in enumerate(zip(raw, indexed)):
+        r.task_definition = definitions[i % N_DEFINITIONS]
+        x.task_definition = indexes[i % N_DEFINITIONS]
+
+    print(f"{n} tasks")
+    expected, base = run("raw", raw, legacy_task_info_to_targets)
+    targets, fast = run("indexed", indexed, task_info_to_targets)
+    assert summary(expected) == summary(targets)
+    print(f"speedup x{base / fast:.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
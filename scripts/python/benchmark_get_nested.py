@@ -0,0 +1,42 @@
+"""Compare utils.get_nested with a compiled NestedPath over a list of AWS-style responses.
+
+python benchmark_get_nested.py [n_records]
+"""
+
+import sys
+import time
+
+from utils import NestedPath, get_nested
+
+KEYS = ["ResponseMetadata", "HTTPStatusCode"]
+
+
+def run(label, fn):
+    start = time.perf_counter()
+    values = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed:8.3f}s")
+    return values, elapsed
+
+
+def main(n):
+    records = [
+        (
+            {"ResponseMetadata": {"HTTPStatusCode": 200, "RequestId": str(i)}}
+            if i % 100
+            else {"ResponseMetadata": {}}
+        )
+        for i in range(n)
+    ]
+    path = NestedPath("ResponseMetadata.HTTPStatusCode")
+    print(f"{n} records")
+    expected, base = run("get_nested", lambda: [get_nested(r, KEYS) for r in records])
+    values, single = run("NestedPath.get", lambda: [path.get(r) for r in records])
+    assert values == expected
+    values, many = run("NestedPath.get_many", lambda: path.get_many(records))
+    assert values == expected
+    print(f"speedup get x{base / single:.2f}, get_many x{base / many:.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
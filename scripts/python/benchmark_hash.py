@@ -0,0 +1,50 @@
+"""Per-message cost of building SQS/Kinesis entries with each digest.
+
+python benchmark_hash.py [n_records]
+"""
+
+import hashlib
+import json
+import sys
+import time
+
+from utils import HASH_ALGORITHMS
+from utils.aws import kinesis, sqs
+
+
+def legacy_build(message_data):
+    # sha1 over the str body, as sqs.build/kinesis.build used to do
+    data = json.dumps(message_data, sort_keys=True)
+    return {"Id": hashlib.sha1(data.encode("utf-8")).hexdigest(), "MessageBody": data}
+
+
+def run(label, fn, records):
+    start = time.perf_counter()
+    for r in records:
+        fn(r)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed:8.2f}s {elapsed / len(records) * 1e6:8.2f}us/msg")
+
+
+def main(n):
+    records = [
+        {
+            "path": "ADD_OUTCOME",
+            "kwargs": {"asset_id": f"asset:product-tagger/{i:032x}", "n": i},
+        }
+        for i in range(n)
+    ]
+    payloads = [json.dumps(r, sort_keys=True).encode("ascii") for r in records]
+    print(f"{n} records")
+    for name, digest in HASH_ALGORITHMS.items():
+        run(f"digest {name}", digest, payloads)
+    run("sqs.build legacy sha1", legacy_build, records)
+    for name in HASH_ALGORITHMS:
+        run(f"sqs.build {name}", lambda r: sqs.build(r, algorithm=name), records)
+        run(
+            f"kinesis.build {name}", lambda r: kinesis.build(r, algorithm=name), records
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
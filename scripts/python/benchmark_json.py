@@ -0,0 +1,79 @@
+"""Check utils.dumps is byte-identical to json.dumps(sort_keys=True) and time both.
+
+python benchmark_json.py [n_records]
+"""
+
+import json
+import random
+import sys
+import time
+from enum import Enum
+
+from utils import AutoEncoder, dumps, ujson
+
+
+class Flow(Enum):
+    ENTRY = "product-entry"
+    REVIEW = "review"
+
+
+class Uri:
+    def __init__(self, uri):
+        self.uri = uri
+
+    def _json(self):
+        return self.uri
+
+
+def record(i):
+    return {
+        "path": "ADD_OUTCOME",
+        "kwargs": {
+            "timestamp": f"2019-10-15T17:29:{i % 60:02d}.835379",
+            "actor": "silkasara.peter@rrd.com",
+            "flow": random.choice(list(Flow)),
+            "queue": "entry",
+            "asset_id": Uri(f"asset:product-tagger/{i:032x}"),
+            "updated_fields": {
+                "isGeneralBranding": bool(i % 2),
+                "marketingCompanyURI": "taxonomy-v1/company/399",
+                "productURIs": [f"taxonomy-v1/product/{i + j}" for j in range(3)],
+                "score": round(random.random() * 100, random.randint(0, 6)),
+                "weight": random.random(),
+                "note": "café ☃",
+            },
+        },
+    }
+
+
+def run(label, fn, records):
+    start = time.perf_counter()
+    for r in records:
+        fn(r)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {elapsed:8.2f}s {elapsed / len(records) * 1e6:8.2f}us/msg")
+    return elapsed
+
+
+def compare(label, records):
+    mismatches = sum(
+        dumps(r) != json.dumps(r, sort_keys=True, cls=AutoEncoder) for r in records
+    )
+    print(f"{label}: {len(records)} records, mismatches={mismatches}")
+    stdlib = run(
+        "json", lambda r: json.dumps(r, sort_keys=True, cls=AutoEncoder), records
+    )
+    fast = run("utils.dumps", dumps, records)
+    print(f"speedup x{stdlib / fast:.2f}")
+
+
+def main(n):
+    print(f"ujson={'yes' if ujson else 'no'}")
+    records = [record(i) for i in range(n)]
+    compare("with Enum/_json hooks", records)
+    # Same payloads once the hooks have been applied, i.e. only plain types.
+    compare("plain", [json.loads(json.dumps(r, cls=AutoEncoder)) for r in records])
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,62 @@
+"""Time utils.logger.Logger against the structlog processor chain it replaced.
+
+Lines are rendered but discarded, so only logging overhead is measured.
+
+python benchmark_logger.py [n_events]
+"""
+
+import json
+import logging
+import sys
+import time
+
+from structlog import ReturnLogger, wrap_logger
+from structlog.processors import JSONRenderer, TimeStamper
+from utils.logger import Logger
+
+CONTEXT = {
+    "service": "omni-taxonomy-consumer",
+    "queue": "entry",
+    "asset_id": "asset:product-tagger/0000000000000000000000000000002a",
+    "tags": ["a", "b", "c"],
+}
+
+
+def run(label, fn, n):
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<14} {elapsed:8.2f}s {elapsed / n * 1e6:8.2f}us/event")
+    return elapsed
+
+
+def main(n):
+    structlog_logger = wrap_logger(
+        ReturnLogger(),
+        processors=[TimeStamper(fmt="iso"), JSONRenderer(sort_keys=True)],
+    ).bind(**CONTEXT)
+    logger = Logger(sink=lambda line: None, **CONTEXT)
+
+    old = json.loads(structlog_logger.msg("event", level=logging.INFO, i=1))
+    new = json.loads(logger.info("event", i=1))
+    assert old.pop("timestamp") and new.pop("timestamp") and old == new
+
+    baseline = run(
+        "structlog", lambda i: structlog_logger.msg("event", level=20, i=i), n
+    )
+    fast = run("Logger", lambda i: logger.info("event", i=i), n)
+    print(f"speedup x{baseline / fast:.2f}")
+    run("Logger debug", lambda i: logger.debug("event", i=i), n)
+
+    background = Logger(sink=lambda line: None, background=True, **CONTEXT)
+    hot = run("background", lambda i: background.info("event", i=i), n)
+    start = time.perf_counter()
+    background.flush()
+    print(
+        f"caller x{baseline / hot:.2f}, drained in {time.perf_counter() - start:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
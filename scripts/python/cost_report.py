@@ -3,16 +3,20 @@ from datetime import datetime, timedelta, timezone
 
 import click
 
-import boto3
 from botocore.exceptions import ClientError
 from lpipe.utils import check_status, get_nested, hash
 from tabulate import tabulate
 from tqdm import tqdm
 from utils import batch
-from utils.aws import auth
+from utils.aws import auth, get_client
+from utils.cache import task_definition_store
 
 REGION = "us-east-2"
 
+# On-disk cache of task definition revisions, shared with discover.py; set by
+# --task-definition-cache.
+_task_definitions = None
+
 
 def _call(_callable, *args, **kwargs):
     try:
@@ -97,9 +101,14 @@ class TaskDefinition(Resource):
 
     @classmethod
     def load(cls, arn):
-        client = boto3.client("ecs", region_name=REGION)
-        response = _call(client.describe_task_definition, taskDefinition=arn)
-        return cls(response["taskDefinition"])
+        def fetch(arn):
+            client = get_client("ecs", region_name=REGION)
+            response = _call(client.describe_task_definition, taskDefinition=arn)
+            return response["taskDefinition"]
+
+        if _task_definitions is not None:
+            return cls(_task_definitions.get(arn, fetch))
+        return cls(fetch(arn))
 
 
 class Service(Resource):
@@ -167,7 +176,7 @@ class Service(Resource):
         print(f"Found {len(services)} services.")
         if not services:
             return {}
-        client = boto3.client("ecs", region_name=REGION)
+        client = get_client("ecs", region_name=REGION)
         _services = {}
         print("Describing services...")
         for b in tqdm(batch(services, 10)):
@@ -188,7 +197,7 @@ class Service(Resource):
         def _values(r):
             return (r["serviceArns"], r.get("nextToken", None))
 
-        client = boto3.client("ecs", region_name=REGION)
+        client = get_client("ecs", region_name=REGION)
         service_arns = []
         print("Listing services...")
         arns, next_token = _values(
@@ -212,8 +221,16 @@ class Service(Resource):
 @click.option("--sort", default="cpu")
 @click.option("--env", default="prod")
 @click.option("--cluster", default="default")
-def cmd(env, sort, cluster):
-    with auth([f"everest-{env}"]):
+@click.option(
+    "--task-definition-cache",
+    default=None,
+    help="SQLite file caching task definitions, shared with discover.py.",
+)
+def cmd(env, sort, cluster, task_definition_cache):
+    global _task_definitions
+    if task_definition_cache:
+        _task_definitions = task_definition_store(task_definition_cache)
+    with auth([f"everest-{env}"], inject=True):
         services = list(Service.load_all(cluster=cluster).values())
         services = [s for s in services if s.desired_count > 0]
         services.sort(key=lambda x: getattr(x, sort)[1], reverse=True)
@@ -223,6 +240,8 @@ def cmd(env, sort, cluster):
         print("Loading task definitions...")
         for s in tqdm(services):
             s.task_definition
+        if _task_definitions is not None:
+            print(f"Task definitions: {_task_definitions!r}")
 
         print("Tabulating...")
         table = [s.tabulate for s in services]
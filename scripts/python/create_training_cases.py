@@ -19,7 +19,6 @@ from django.conf import settings
 from django.core.management.base import BaseCommand
 from elasticsearch_dsl import Q, Search
 from mintel_logging import LogLevel
-from sherpa.utils import batch
 from tqdm import tqdm
 
 warnings.filterwarnings("ignore", "unclosed")
@@ -623,10 +622,8 @@ def delete_existing_sets():
         tqdm.write("Deleting all existing cases in s3.")
         s3 = boto3.resource("s3")
         bucket = s3.Bucket(settings.TRAINING_CASES_S3_BUCKET)
-        keys = [{"Key": object.key} for object in bucket.objects.all()]
-        if keys:
-            for key_batch in batch(keys, 100):
-                bucket.delete_objects(Delete={"Objects": key_batch})
+        # Batch action: one delete_objects call per listing page, streamed.
+        bucket.objects.all().delete()
 
 
 def write_sets(sets_to_write):
@@ -1,14 +1,22 @@
 from __future__ import print_function
 
 import argparse
+import collections
+import contextlib
+import hashlib
 import json
 import os
 import re
+import threading
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
-
+import botocore.config
+from botocore.exceptions import ClientError
+from utils.cache import Cache, task_definition_store
+from utils.logger import Timings
 
 """
 Copyright 2018 Signal Media Ltd
@@ -40,7 +48,15 @@ and metrics are exposed at a service level. This way, no ec2/ecs labels
 will be exposed and the instance label will always point to the job name.
 
 PROMETHEUS_PORT can be used for tasks using classic ELB setup with multiple
-port mappings.
+port mappings. A comma separated list of ports gives a target per port.
+
+PROMETHEUS_CONTAINER_PORTS is a comma separated list of container ports; a
+target is made for every network binding of one of those ports, using the
+host port ECS assigned to it, e.g. "8080,9100" for dynamic port mappings.
+
+Without either, only a container's first networkBinding is scraped.
+
+Every container with PROMETHEUS set gets its own targets.
 """
 
 
@@ -59,46 +75,39 @@ def dict_get(d, k, default):
         return default
 
 
-class FlipCache:
-    def __init__(self):
-        self.current_cache = {}
-        self.next_cache = {}
-        self.hits = 0
-        self.misses = 0
-
-    def flip(self):
-        self.current_cache = self.next_cache
-        self.next_cache = {}
-        self.hits = 0
-        self.misses = 0
-
-    def get_dict(self, keys, fetcher):
-        missing = []
-        result = {}
-        for k in set(keys):
-            if k in self.current_cache:
-                result[k] = self.current_cache[k]
-                self.hits += 1
-            else:
-                missing += [k]
-                self.misses += 1
-        fetched = fetcher(missing) if missing else {}
-        result.update(fetched)
-        self.current_cache.update(fetched)
-        self.next_cache.update(result)
-        return result
-
-    def get(self, key, fetcher):
-        if key in self.current_cache:
-            result = self.current_cache[key]
-            self.hits += 1
-        else:
-            self.misses += 1
-            result = fetcher(key)
-        if result:
-            self.current_cache[key] = result
-            self.next_cache[key] = result
-        return result
+# Calls per second allowed for each API, shared by all discovery threads.
+API_RATE_LIMITS = {
+    "list_clusters": 20,
+    "list_tasks": 20,
+    "describe_tasks": 20,
+    "describe_task_definition": 20,
+    "describe_container_instances": 20,
+    "describe_instances": 20,
+}
+
+
+class RateLimiter:
+    """Token bucket shared by every thread calling one API."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst else rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # Reserve a token now, sleeping off any debt outside the lock.
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
 
 
 class TaskInfo:
@@ -113,93 +122,171 @@ class TaskInfo:
 
 
 class TaskInfoDiscoverer:
-    def __init__(self):
-        self.ec2_client = boto3.client("ec2")
-        self.ecs_client = boto3.client("ecs")
-        self.task_cache = FlipCache()
-        self.task_definition_cache = FlipCache()
-        self.container_instance_cache = FlipCache()
-        self.ec2_instance_cache = FlipCache()
-
-    def flip_caches(self):
-        self.task_cache.flip()
-        self.task_definition_cache.flip()
-        self.container_instance_cache.flip()
-        self.ec2_instance_cache.flip()
+    def __init__(
+        self,
+        cache_idle_ttl=300,
+        cache_size=10000,
+        max_workers=16,
+        rate_limits=None,
+        task_definition_cache=None,
+    ):
+        client_config = botocore.config.Config(max_pool_connections=max_workers * 2)
+        self.ec2_client = boto3.client("ec2", config=client_config)
+        self.ecs_client = boto3.client("ecs", config=client_config)
+        self.max_workers = max_workers
+        # Clusters run on their own pool; API fetches for every cluster share this one.
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.limiters = {
+            api: RateLimiter(rate)
+            for api, rate in {**API_RATE_LIMITS, **(rate_limits or {})}.items()
+        }
+        self.timings = Timings()
+        self.task_arns = {}  # cluster ARN -> task ARNs listed on the last run
+        self.task_changes = collections.Counter()
+        self.task_changes_lock = threading.Lock()
+        # Entries not used by a discovery run for cache_idle_ttl seconds expire.
+        self.task_cache = Cache(maxsize=cache_size, idle_ttl=cache_idle_ttl)
+        self.task_definition_cache = Cache(maxsize=cache_size, idle_ttl=cache_idle_ttl)
+        # Task definition revisions are immutable, so with task_definition_cache
+        # set they are also kept on disk and survive restarts.
+        self.task_definition_store = (
+            task_definition_store(task_definition_cache)
+            if task_definition_cache
+            else None
+        )
+        self.container_instance_cache = Cache(
+            maxsize=cache_size, idle_ttl=cache_idle_ttl
+        )
+        self.ec2_instance_cache = Cache(maxsize=cache_size, idle_ttl=cache_idle_ttl)
+
+    @property
+    def caches(self):
+        return {
+            "task_cache": self.task_cache,
+            "task_definition_cache": self.task_definition_cache,
+            "container_instance_cache": self.container_instance_cache,
+            "ec2_instance_cache": self.ec2_instance_cache,
+        }
+
+    def expire_caches(self):
+        for cache in self.caches.values():
+            cache.expire()
+            cache.reset_stats()
+
+    def call(self, client, api, **kwargs):
+        """Call a client method within its rate limit, timing it."""
+        self.limiters[api].acquire()
+        start = time.time()
+        try:
+            return getattr(client, api)(**kwargs)
+        finally:
+            self.timings.record(api, time.time() - start)
+
+    def paginate(self, client, api, key, **kwargs):
+        """Yield each non-empty page of `key` from a paginated API."""
+        while True:
+            result = self.call(client, api, **kwargs)
+            if result.get(key):
+                yield result[key]
+            if not result.get("nextToken"):
+                return
+            kwargs["nextToken"] = result["nextToken"]
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings.record("stage:" + name, time.time() - start)
+
+    def has_network_bindings(self, task):
+        """False if a PROMETHEUS container has no networkBinding yet."""
+        no_network_binding = []
+        for container in task["containers"]:
+            if (
+                "networkBindings" not in container
+                or len(container["networkBindings"]) == 0
+            ):
+                no_network_binding.append(container["name"])
+        if not no_network_binding:
+            return True
+        task_definition = self.task_definition_cache.get(
+            task["taskDefinitionArn"], self.load_task_definition
+        )
+        for container in task_definition.containers:
+            if container.name in no_network_binding and container.prometheus:
+                log(
+                    task["group"]
+                    + ":"
+                    + container.name
+                    + " does not have a networkBinding. Skipping for next run."
+                )
+                return False
+        return True
 
     def describe_tasks(self, cluster_arn, task_arns):
-        def fetcher_task_definition(arn):
-            return self.ecs_client.describe_task_definition(taskDefinition=arn)[
-                "taskDefinition"
-            ]
-
         def fetcher(fetch_task_arns):
             tasks = {}
-            result = self.ecs_client.describe_tasks(
-                cluster=cluster_arn, tasks=fetch_task_arns
+            result = self.call(
+                self.ecs_client,
+                "describe_tasks",
+                cluster=cluster_arn,
+                tasks=fetch_task_arns,
             )
-            if "tasks" in result:
-                for task in result["tasks"]:
-                    no_network_binding = []
-                    for container in task["containers"]:
-                        if (
-                            "networkBindings" not in container
-                            or len(container["networkBindings"]) == 0
-                        ):
-                            no_network_binding.append(container["name"])
-                    if no_network_binding:
-                        arn = task["taskDefinitionArn"]
-                        no_cache = None
-                        task_definition = self.task_definition_cache.get(
-                            arn, fetcher_task_definition
-                        )
-                        for container_definition in task_definition[
-                            "containerDefinitions"
-                        ]:
-                            prometheus = get_environment_var(
-                                container_definition["environment"], "PROMETHEUS"
-                            )
-                            if (
-                                container_definition["name"] in no_network_binding
-                                and prometheus
-                            ):
-                                log(
-                                    task["group"]
-                                    + ":"
-                                    + container_definition["name"]
-                                    + " does not have a networkBinding. Skipping for next run."
-                                )
-                                no_cache = True
-                        if not no_cache:
-                            tasks[task["taskArn"]] = task
-                    else:
-                        tasks[task["taskArn"]] = task
+            for task in dict_get(result, "tasks", []):
+                if self.has_network_bindings(task):
+                    tasks[task["taskArn"]] = task
             return tasks
 
         return self.task_cache.get_dict(task_arns, fetcher).values()
 
     def create_task_infos(self, cluster_arn, task_arns):
-        return map(lambda t: TaskInfo(t), self.describe_tasks(cluster_arn, task_arns))
+        return [TaskInfo(t) for t in self.describe_tasks(cluster_arn, task_arns)]
 
-    def add_task_definitions(self, task_infos):
-        def fetcher(arn):
-            return self.ecs_client.describe_task_definition(taskDefinition=arn)[
-                "taskDefinition"
-            ]
+    def fetch_task_definition(self, arn):
+        return self.call(
+            self.ecs_client, "describe_task_definition", taskDefinition=arn
+        )["taskDefinition"]
 
+    def load_task_definition(self, arn):
+        if self.task_definition_store is not None:
+            return TaskDefinitionIndex(
+                self.task_definition_store.get(arn, self.fetch_task_definition)
+            )
+        return TaskDefinitionIndex(self.fetch_task_definition(arn))
+
+    def add_task_definitions(self, task_infos):
+        arns = list(set(t.task["taskDefinitionArn"] for t in task_infos))
+        task_definitions = dict(
+            zip(
+                arns,
+                self.pool.map(
+                    lambda arn: self.task_definition_cache.get(
+                        arn, self.load_task_definition
+                    ),
+                    arns,
+                ),
+            )
+        )
         for task_info in task_infos:
             arn = task_info.task["taskDefinitionArn"]
-            task_info.task_definition = self.task_definition_cache.get(arn, fetcher)
+            task_info.task_definition = task_definitions[arn]
 
     def add_container_instances(self, task_infos, cluster_arn):
+        def describe(arns):
+            result = self.call(
+                self.ecs_client,
+                "describe_container_instances",
+                cluster=cluster_arn,
+                containerInstances=arns,
+            )
+            return dict_get(result, "containerInstances", [])
+
         def fetcher(arns):
-            arnsChunked = chunk_list(arns, 100)
             instances = {}
-            for arns in arnsChunked:
-                result = self.ecs_client.describe_container_instances(
-                    cluster=cluster_arn, containerInstances=arns
-                )
-                for i in dict_get(result, "containerInstances", []):
+            for chunk in self.pool.map(describe, chunk_list(arns, 100)):
+                for i in chunk:
                     instances[i["containerInstanceArn"]] = i
             return instances
 
@@ -215,14 +302,19 @@ class TaskInfoDiscoverer:
             )
 
     def add_ec2_instances(self, task_infos):
+        def describe(ids):
+            result = self.call(self.ec2_client, "describe_instances", InstanceIds=ids)
+            return [
+                i
+                for r in dict_get(result, "Reservations", [])
+                for i in dict_get(r, "Instances", [])
+            ]
+
         def fetcher(ids):
-            idsChunked = chunk_list(ids, 100)
             instances = {}
-            for ids in idsChunked:
-                result = self.ec2_client.describe_instances(InstanceIds=ids)
-                for r in dict_get(result, "Reservations", []):
-                    for i in dict_get(r, "Instances", []):
-                        instances[i["InstanceId"]] = i
+            for chunk in self.pool.map(describe, chunk_list(ids, 100)):
+                for i in chunk:
+                    instances[i["InstanceId"]] = i
             return instances
 
         instance_ids = list(
@@ -234,43 +326,93 @@ class TaskInfoDiscoverer:
                 instances, t.container_instance["ec2InstanceId"], None
             )
 
+    def complete_task_infos(self, task_infos):
+        """Add task definitions, container and EC2 instances to described tasks."""
+        by_cluster = defaultdict(list)
+        for t in task_infos:
+            by_cluster[t.task["clusterArn"]].append(t)
+        self.add_task_definitions(task_infos)
+        for cluster_arn, cluster_task_infos in by_cluster.items():
+            self.add_container_instances(cluster_task_infos, cluster_arn)
+        task_infos = [t for t in task_infos if t.container_instance]
+        self.add_ec2_instances(task_infos)
+        return [t for t in task_infos if t.valid()]
+
+    def forget_task(self, task_arn):
+        self.task_cache.pop(task_arn)
+
     def get_infos_for_cluster(self, cluster_arn):
-        tasks_pages = self.ecs_client.get_paginator("list_tasks").paginate(
-            cluster=cluster_arn, launchType="EC2"
-        )
-        task_infos = []
-        for task_arns in tasks_pages:
-            if task_arns["taskArns"]:
-                task_infos += self.create_task_infos(cluster_arn, task_arns["taskArns"])
+        # Describe each page of tasks while the next one is being listed.
+        # Tasks seen on a previous run come from task_cache, so only new ARNs
+        # are described.
+        listed = set()
+        pages = []
+        for task_arns in self.paginate(
+            self.ecs_client,
+            "list_tasks",
+            "taskArns",
+            cluster=cluster_arn,
+            launchType="EC2",
+        ):
+            listed.update(task_arns)
+            pages.append(
+                self.pool.submit(self.create_task_infos, cluster_arn, task_arns)
+            )
+        previous = self.task_arns.get(cluster_arn, set())
+        for task_arn in previous - listed:
+            self.forget_task(task_arn)
+        self.task_arns[cluster_arn] = listed
+        with self.task_changes_lock:
+            self.task_changes.update(
+                added=len(listed - previous), removed=len(previous - listed)
+            )
+        task_infos = [t for page in pages for t in page.result()]
         self.add_task_definitions(task_infos)
         self.add_container_instances(task_infos, cluster_arn)
         return task_infos
 
     def print_cache_stats(self):
+        log(" ".join(f"{name} {cache!r}" for name, cache in self.caches.items()))
+        if self.task_definition_store is not None:
+            log(f"task_definition_store {self.task_definition_store!r}")
+
+    def print_timings(self):
+        for action, t in sorted(self.timings.snapshot(reset=True).items()):
+            if t["count"]:
+                log(
+                    "{} count {} total {:.3f}s p50 {:.3f}s p99 {:.3f}s".format(
+                        action, t["count"], t["sum"], t["p50"], t["p99"]
+                    )
+                )
+
+    def get_infos(self):
+        self.expire_caches()
+        self.task_changes.clear()
+        with self.stage("list_clusters"):
+            cluster_arns = [
+                arn
+                for page in self.paginate(
+                    self.ecs_client, "list_clusters", "clusterArns"
+                )
+                for arn in page
+            ]
+        with self.stage("clusters"), ThreadPoolExecutor(
+            max_workers=self.max_workers
+        ) as clusters:
+            task_infos = [
+                t
+                for infos in clusters.map(self.get_infos_for_cluster, cluster_arns)
+                for t in infos
+            ]
+        with self.stage("ec2_instances"):
+            self.add_ec2_instances(task_infos)
         log(
-            "task_cache {} {} task_definition_cache {} {} {} container_instance_cache {} {} ec2_instance_cache {} {} {}".format(
-                self.task_cache.hits,
-                self.task_cache.misses,
-                self.task_definition_cache.hits,
-                self.task_definition_cache.misses,
-                len(self.task_definition_cache.current_cache),
-                self.container_instance_cache.hits,
-                self.container_instance_cache.misses,
-                self.ec2_instance_cache.hits,
-                self.ec2_instance_cache.misses,
-                len(self.ec2_instance_cache.current_cache),
+            "Tasks added {} removed {}".format(
+                self.task_changes["added"], self.task_changes["removed"]
             )
         )
-
-    def get_infos(self):
-        self.flip_caches()
-        task_infos = []
-        clusters_pages = self.ecs_client.get_paginator("list_clusters").paginate()
-        for clusters in clusters_pages:
-            for cluster_arn in clusters["clusterArns"]:
-                task_infos += self.get_infos_for_cluster(cluster_arn)
-        self.add_ec2_instances(task_infos)
         self.print_cache_stats()
+        self.print_timings()
         return task_infos
 
 
@@ -287,6 +429,7 @@ class Target:
         ecs_container_id,
         ecs_cluster_name,
         ec2_instance_id,
+        path_interval=None,
     ):
         self.ip = ip
         self.port = port
@@ -298,6 +441,11 @@ class Target:
         self.ecs_container_id = ecs_container_id
         self.ecs_cluster_name = ecs_cluster_name
         self.ec2_instance_id = ec2_instance_id
+        self.path_interval = (
+            path_interval
+            if path_interval is not None
+            else extract_path_interval(metrics_path)
+        )
 
 
 def get_environment_var(environment, name):
@@ -332,132 +480,325 @@ def extract_path_interval(env_variable):
     return path_interval
 
 
+ContainerSpec = collections.namedtuple(
+    "ContainerSpec",
+    [
+        "name",
+        "prometheus",
+        "metrics_path",
+        "path_interval",
+        "ports",
+        "container_ports",
+        "nolabels",
+    ],
+)
+
+
+def _split_ports(value):
+    return [p.strip() for p in (value or "").split(",") if p.strip()]
+
+
+class TaskDefinitionIndex:
+    """A task definition with its containers' PROMETHEUS_* settings parsed once.
+
+    Built when the definition is fetched and cached alongside it, so target
+    generation does not rescan environment lists or re-split ARNs each loop.
+    """
+
+    def __init__(self, task_definition):
+        self.task_definition = task_definition
+        arn = task_definition["taskDefinitionArn"]
+        self.name = extract_name(arn)
+        self.version = extract_task_version(arn)
+        self.containers = []
+        for container_definition in task_definition["containerDefinitions"]:
+            environment = {
+                e["name"]: e["value"]
+                for e in container_definition.get("environment", [])
+            }
+            metrics_path = environment.get("PROMETHEUS_ENDPOINT")
+            self.containers.append(
+                ContainerSpec(
+                    name=container_definition["name"],
+                    prometheus=environment.get("PROMETHEUS"),
+                    metrics_path=metrics_path,
+                    path_interval=extract_path_interval(metrics_path),
+                    ports=_split_ports(environment.get("PROMETHEUS_PORT")),
+                    container_ports=_split_ports(
+                        environment.get("PROMETHEUS_CONTAINER_PORTS")
+                    ),
+                    nolabels=environment.get("PROMETHEUS_NOLABELS") == "true",
+                )
+            )
+        self.prometheus_containers = [c for c in self.containers if c.prometheus]
+
+
 def task_info_to_targets(task_info):
+    """One target per port of every PROMETHEUS-enabled container in the task."""
     if not task_info.valid():
         return []
-    for container_definition in task_info.task_definition["containerDefinitions"]:
-        prometheus = get_environment_var(
-            container_definition["environment"], "PROMETHEUS"
-        )
-        metrics_path = get_environment_var(
-            container_definition["environment"], "PROMETHEUS_ENDPOINT"
-        )
-        nolabels = get_environment_var(
-            container_definition["environment"], "PROMETHEUS_NOLABELS"
-        )
-        prom_port = get_environment_var(
-            container_definition["environment"], "PROMETHEUS_PORT"
-        )
-        if nolabels != "true":
-            nolabels = None
-        containers = filter(
-            lambda c: c["name"] == container_definition["name"],
-            task_info.task["containers"],
-        )
-        if prometheus:
-            for container in containers:
-                ecs_task_name = extract_name(task_info.task["taskDefinitionArn"])
-                if prom_port:
-                    first_port = prom_port
-                else:
-                    first_port = str(container["networkBindings"][0]["hostPort"])
-                if nolabels:
-                    p_instance = ecs_task_name
-                    ecs_task_id = (
-                        ecs_task_version
-                    ) = ecs_container_id = ecs_cluster_name = ec2_instance_id = None
+    targets = []
+    task_definition = task_info.task_definition
+    ip = task_info.ec2_instance["PrivateIpAddress"]
+    for spec in task_definition.prometheus_containers:
+        for container in task_info.task["containers"]:
+            if container["name"] != spec.name:
+                continue
+            if spec.ports:
+                ports = spec.ports
+            elif spec.container_ports:
+                ports = [
+                    str(b["hostPort"])
+                    for b in container.get("networkBindings", [])
+                    if str(b.get("containerPort")) in spec.container_ports
+                ]
+            else:
+                ports = [str(container["networkBindings"][0]["hostPort"])]
+            for port in ports:
+                if spec.nolabels:
+                    p_instance = task_definition.name
+                    ecs_task_id = ecs_task_version = ecs_container_id = (
+                        ecs_cluster_name
+                    ) = ec2_instance_id = None
                 else:
-                    p_instance = (
-                        task_info.ec2_instance["PrivateIpAddress"] + ":" + first_port
-                    )
+                    p_instance = ip + ":" + port
                     ecs_task_id = extract_name(task_info.task["taskArn"])
-                    ecs_task_version = extract_task_version(
-                        task_info.task["taskDefinitionArn"]
-                    )
+                    ecs_task_version = task_definition.version
                     ecs_container_id = extract_name(container["containerArn"])
                     ecs_cluster_name = extract_name(task_info.task["clusterArn"])
                     ec2_instance_id = task_info.container_instance["ec2InstanceId"]
-
-                return [
+                targets.append(
                     Target(
-                        ip=task_info.ec2_instance["PrivateIpAddress"],
-                        port=first_port,
-                        metrics_path=metrics_path,
+                        ip=ip,
+                        port=port,
+                        metrics_path=spec.metrics_path,
                         p_instance=p_instance,
                         ecs_task_id=ecs_task_id,
-                        ecs_task_name=ecs_task_name,
+                        ecs_task_name=task_definition.name,
                         ecs_task_version=ecs_task_version,
                         ecs_container_id=ecs_container_id,
                         ecs_cluster_name=ecs_cluster_name,
                         ec2_instance_id=ec2_instance_id,
+                        path_interval=spec.path_interval,
                     )
-                ]
-    return []
+                )
+    return targets
+
+
+INTERVALS = ["15s", "30s", "1m", "5m"]
+
+_encode = json.JSONEncoder(sort_keys=True).encode
+
+
+def serialize_jobs(jobs):
+    """Yield a file_sd JSON document for `jobs` in chunks, one job per line."""
+    yield "["
+    for n, job in enumerate(jobs):
+        yield ("\n" if n == 0 else ",\n") + _encode(job)
+    yield "\n]\n"
 
 
 class Main:
-    def __init__(self, directory, interval):
+    def __init__(
+        self, directory, interval, events_queue_url=None, task_definition_cache=None
+    ):
         self.directory = directory
         self.interval = interval
-        self.discoverer = TaskInfoDiscoverer()
+        self.discoverer = TaskInfoDiscoverer(
+            task_definition_cache=task_definition_cache
+        )
+        self.task_infos = {}
+        self.job_hashes = {}
+        self.events_queue_url = events_queue_url
+        self.sqs_client = boto3.client("sqs") if events_queue_url else None
 
     def write_jobs(self, jobs):
+        """Write each job file whose content changed since it was last written."""
         for i, j in jobs.items():
             file_name = self.directory + "/" + i + "-tasks.json"
+            if i not in self.job_hashes and os.path.exists(file_name):
+                with open(file_name, "rb") as f:
+                    self.job_hashes[i] = hashlib.sha1(f.read()).hexdigest()
+            # Hash first; unchanged jobs cost no file I/O.
+            digest = hashlib.sha1()
+            for chunk in serialize_jobs(j):
+                digest.update(chunk.encode())
+            if self.job_hashes.get(i) == digest.hexdigest():
+                continue
             tmp_file_name = file_name + ".tmp"
             with open(tmp_file_name, "w") as f:
-                f.write(json.dumps(j, indent=4))
+                f.writelines(serialize_jobs(j))
             os.rename(tmp_file_name, file_name)
+            self.job_hashes[i] = digest.hexdigest()
+            log("Wrote {} ({} jobs)".format(file_name, len(j)))
 
     def get_targets(self):
         targets = []
-        infos = self.discoverer.get_infos()
-        for info in infos:
+        for info in self.task_infos.values():
             targets += task_info_to_targets(info)
         return targets
 
     def discover_tasks(self):
+        infos = self.discoverer.get_infos()
+        self.task_infos = {info.task["taskArn"]: info for info in infos}
+        self.update_jobs()
+
+    def update_jobs(self):
         targets = self.get_targets()
-        jobs = defaultdict(list)
-        for i in ["15s", "30s", "1m", "5m"]:
-            jobs[i] = []
+        # Targets sharing every label are scraped as one job.
+        jobs = {i: {} for i in INTERVALS}
         log("Targets: " + str(len(targets)))
         for target in targets:
-            path_interval = extract_path_interval(target.metrics_path)
-            for path, interval in path_interval.items():
-                labels = None
-                if target.ecs_task_name not in target.p_instance:
-                    labels = {
-                        "ecs_task_id": target.ecs_task_id,
-                        "ecs_task_version": target.ecs_task_version,
-                        "ecs_container_id": target.ecs_container_id,
-                        "ecs_cluster": target.ecs_cluster_name,
-                        "instance_id": target.ec2_instance_id,
+            labels = {"instance": target.p_instance, "job": target.ecs_task_name}
+            if target.ecs_task_name not in target.p_instance:
+                labels.update(
+                    ecs_task_id=target.ecs_task_id,
+                    ecs_task_version=target.ecs_task_version,
+                    ecs_container_id=target.ecs_container_id,
+                    ecs_cluster=target.ecs_cluster_name,
+                    instance_id=target.ec2_instance_id,
+                )
+            address = target.ip + ":" + target.port
+            for path, interval in target.path_interval.items():
+                key = tuple(labels.values()) + (path,)
+                job = jobs.setdefault(interval, {}).get(key)
+                if job is None:
+                    jobs[interval][key] = job = {
+                        "targets": [],
+                        "labels": dict(labels, metrics_path=path),
                     }
-                job = {
-                    "targets": [target.ip + ":" + target.port],
-                    "labels": {
-                        "instance": target.p_instance,
-                        "job": target.ecs_task_name,
-                        "metrics_path": path,
-                    },
-                }
-                if labels:
-                    job["labels"].update(labels)
-                jobs[interval].append(job)
-                log(job)
-        self.write_jobs(jobs)
+                if address not in job["targets"]:
+                    job["targets"].append(address)
+        self.write_jobs({i: [jobs[i][key] for key in sorted(jobs[i])] for i in jobs})
+
+    @staticmethod
+    def parse_event(body):
+        """Return the ECS Task State Change event in an SQS message body, or None.
+
+        Accepts EventBridge events delivered directly or wrapped in an SNS
+        notification.
+        """
+        try:
+            event = json.loads(body)
+            if event.get("Type") == "Notification" and "Message" in event:
+                event = json.loads(event["Message"])
+        except (ValueError, TypeError, AttributeError):
+            return None
+        if not isinstance(event, dict) or (
+            event.get("detail-type") != "ECS Task State Change"
+        ):
+            return None
+        task = event.get("detail")
+        if not isinstance(task, dict) or not all(
+            k in task
+            for k in ("taskArn", "clusterArn", "taskDefinitionArn", "containers")
+        ):
+            return None
+        if not isinstance(task["containers"], list) or not all(
+            isinstance(c, dict) and "name" in c for c in task["containers"]
+        ):
+            return None
+        if (
+            task.get("lastStatus") == "RUNNING"
+            and task.get("launchType", "EC2") == "EC2"
+            and "containerInstanceArn" not in task
+        ):
+            return None
+        return event
+
+    def apply_events(self, events):
+        """Apply ECS Task State Change events; returns True if targets changed."""
+        started = {}
+        changed = False
+        for event in events:
+            task = event["detail"]
+            arn = task["taskArn"]
+            if task.get("desiredStatus") == "STOPPED" or task.get("lastStatus") in (
+                "STOPPED",
+                "DEPROVISIONING",
+            ):
+                started.pop(arn, None)
+                if self.task_infos.pop(arn, None):
+                    changed = True
+                self.discoverer.forget_task(arn)
+            elif (
+                task.get("lastStatus") == "RUNNING"
+                and task.get("launchType", "EC2") == "EC2"
+                and arn not in self.task_infos
+                and self.discoverer.has_network_bindings(task)
+            ):
+                started[arn] = TaskInfo(task)
+        for info in self.discoverer.complete_task_infos(list(started.values())):
+            self.task_infos[info.task["taskArn"]] = info
+            changed = True
+        return changed
+
+    def consume_events(self, wait):
+        """Long-poll the events queue once and update jobs from what arrives.
+
+        Every received message is deleted, including ones that are not task
+        events or that fail to apply; the next full resync covers anything
+        missed.
+        """
+        try:
+            response = self.sqs_client.receive_message(
+                QueueUrl=self.events_queue_url,
+                MaxNumberOfMessages=10,
+                WaitTimeSeconds=wait,
+            )
+        except ClientError as e:
+            log("Could not receive events: {}".format(e))
+            time.sleep(wait)
+            return
+        messages = response.get("Messages", [])
+        if not messages:
+            return
+        events = []
+        for m in messages:
+            event = self.parse_event(m["Body"])
+            if event is None:
+                log("Skipping message {}: not a task event".format(m["MessageId"]))
+            else:
+                events.append(event)
+        try:
+            if events and self.apply_events(events):
+                self.update_jobs()
+        except Exception as e:
+            # A malformed event must not crash loop() before the batch is
+            # deleted, or it would be redelivered after every restart.
+            log("Could not apply events, waiting for next resync: {!r}".format(e))
+        self.sqs_client.delete_message_batch(
+            QueueUrl=self.events_queue_url,
+            Entries=[
+                {"Id": str(i), "ReceiptHandle": m["ReceiptHandle"]}
+                for i, m in enumerate(messages)
+            ],
+        )
 
     def loop(self):
         while True:
             self.discover_tasks()
-            time.sleep(self.interval)
+            if not self.events_queue_url:
+                time.sleep(self.interval)
+                continue
+            # Apply task state changes as they arrive until the next full resync.
+            resync = time.time() + self.interval
+            while time.time() < resync:
+                self.consume_events(wait=int(min(20, max(resync - time.time(), 1))))
 
 
 def main():
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument("--directory", required=True)
     arg_parser.add_argument("--interval", default=60)
+    arg_parser.add_argument(
+        "--events-queue-url",
+        help="SQS queue receiving ECS Task State Change events from EventBridge",
+    )
+    arg_parser.add_argument(
+        "--task-definition-cache",
+        help="SQLite file caching task definitions across restarts (off if unset)",
+    )
     args = arg_parser.parse_args()
     log(
         "Starting. Directory: "
@@ -466,7 +807,12 @@ def main():
         + str(args.interval)
         + "s."
     )
-    Main(args.directory, float(args.interval)).loop()
+    Main(
+        args.directory,
+        float(args.interval),
+        args.events_queue_url,
+        args.task_definition_cache,
+    ).loop()
 
 
 if __name__ == "__main__":
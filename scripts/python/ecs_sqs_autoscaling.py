@@ -1,10 +1,10 @@
 import json
 from datetime import datetime, timedelta, timezone
 
-import boto3
 from botocore.exceptions import ClientError
-from lpipe.utils import check_status, get_nested, hash
-from utils.aws import auth
+from lpipe.utils import hash
+from utils import compile_path
+from utils.aws import auth, check_status, get_client
 
 # service_name = "pypedream-orchestrator"
 # queue_name = "orchestrator-input-queue.fifo"
@@ -38,7 +38,7 @@ def _call(_callable, *args, **kwargs):
 
 class Queue:
     def __init__(self, name, url=None, now=None):
-        self.client = boto3.client("sqs", region_name=region)
+        self.client = get_client("sqs", region_name=region)
         self.name = name
         self._url = url
         self.now = now if now else datetime.now(tz=timezone.utc)
@@ -100,7 +100,7 @@ class Queue:
                 },
             }
 
-        cloudwatch = boto3.client("cloudwatch", region_name=region)
+        cloudwatch = get_client("cloudwatch", region_name=region)
         response = _call(
             cloudwatch.get_metric_data,
             MetricDataQueries=list(queries.values()),
@@ -171,8 +171,8 @@ class Queue:
     @property
     def url(self):
         if not self._url:
-            self._url = get_nested(
-                _call(self.client.get_queue_url, QueueName=self.name), ["QueueUrl"]
+            self._url = compile_path("QueueUrl").get(
+                _call(self.client.get_queue_url, QueueName=self.name)
             )
         return self._url
 
@@ -192,13 +192,12 @@ class Queue:
                     # ("num_msgs_not_visible", "ApproximateNumberOfMessagesNotVisible"),
                     # ("num_msgs_delayed", "ApproximateNumberOfMessagesDelayed"),
                 )
-                self.attributes = get_nested(
+                self.attributes = compile_path("Attributes").get(
                     _call(
                         self.client.get_queue_attributes,
                         QueueUrl=self.url,
                         AttributeNames=[a[1] for a in attr_map],
-                    ),
-                    ["Attributes"],
+                    )
                 )
                 for a in attr_map:
                     setattr(self, a[0], self.attributes[a[1]])
@@ -214,7 +213,7 @@ class Queue:
 
 class Service:
     def __init__(self, meta):
-        self.client = boto3.client("ecs", region_name=region)
+        self.client = get_client("ecs", region_name=region)
         self.meta = meta
         attr_map = (
             ("name", "serviceName"),
@@ -233,7 +232,7 @@ class Service:
 
     @classmethod
     def load_services(cls, names):
-        client = boto3.client("ecs", region_name=region)
+        client = get_client("ecs", region_name=region)
         descriptions = _call(client.describe_services, services=[service_name])[
             "services"
         ]
@@ -354,7 +353,7 @@ def estimate_msg_processing_ratio_old(queue: Queue):
 
 target_pressure = 5000
 
-with auth(["everest-qa"]):
+with auth(["everest-qa"], inject=True):
     queue = Queue(queue_name, now=now)
     # service = Service.load([service_name])[service_name]
     # pct_of_desired_pressure = estimate_pct_of_desired_pressure(
@@ -6,22 +6,18 @@ from lpipe import sqs
 from lpipe.utils import batch, check_status, get_nested, hash
 from multi_sqs_listener import EventBus, MultiSQSListener, QueueConfig
 from utils.aws import auth, check_status
+from utils.aws.sqs import list_queue_pairs, name_from_url
 
 name_prefix = "lam-asset-collector"
 
 
 with auth(["everest-prod"]):
-    client = boto3.client("sqs", region_name="us-east-2")
-    response = client.list_queues(QueueNamePrefix=name_prefix)
-    check_status(response)
-    queue_urls = response["QueueUrls"]
+    pair = list_queue_pairs(name_prefix, region_name="us-east-2")[0]
 
-    _queue = [q for q in queue_urls if "dlq" not in q][0]
-    QUEUE = {"name": _queue.split("/")[-1], "url": _queue}
+    QUEUE = {"name": pair.name, "url": pair.url}
     print(f"QUEUE: {QUEUE}")
 
-    _dlq = [q for q in queue_urls if "dlq" in q][0]
-    DLQ = {"name": _dlq.split("/")[-1], "url": _dlq}
+    DLQ = {"name": name_from_url(pair.dlq_url), "url": pair.dlq_url}
     print(f"DLQ: {DLQ}")
 
 
@@ -1,4 +1,3 @@
-import hashlib
 import json
 from datetime import datetime, timedelta
 
@@ -13,6 +12,7 @@ from everest_elasticsearch_dsl.documents.staging.product_tagger_outcome import (
     ProductTaggerOutcome,
 )
 from tqdm import tqdm
+from utils.aws import kinesis
 
 DRY_RUN = False
 STREAM_NAME = "kin-st-sas-shepherd"
@@ -22,31 +22,12 @@ CUTOFF = NOW - timedelta(days=14)
 # CUTOFF = NOW - timedelta(days=1)
 
 
-def batch(iterable, n=1):
-    iter_len = len(iterable)
-    for ndx in range(0, iter_len, n):
-        yield iterable[ndx : min(ndx + n, iter_len)]
-
-
-def hash(encoded_data):
-    return hashlib.sha1(encoded_data.encode("utf-8")).hexdigest()
-
-
 def batch_put_records(stream_name, records, batch_size=500):
     """Put records into a kinesis stream, batched by the maximum of 500."""
     client = boto3_client("kinesis", region_name="us-east-2")
-
-    def build(r):
-        data = json.dumps(r, sort_keys=True)
-        return {"Data": data, "PartitionKey": hash(data)}
-
-    output = []
-    for b in batch(records, batch_size):
-        result = client.put_records(
-            StreamName=stream_name, Records=[build(record) for record in b]
-        )
-        output.append(result)
-    return tuple(output)
+    return kinesis.batch_put_records(
+        stream_name, records, batch_size=batch_size, client=client
+    )
 
 
 def put_record(stream_name, data, **kwargs):
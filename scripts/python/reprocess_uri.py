@@ -1,12 +1,11 @@
 # setup
-import boto3
 from lpipe.contrib import sqs
-from utils.aws import auth
+from utils.aws import auth, get_client
+from utils.aws.sqs import list_queue_pairs
 
 with auth(["everest-qa"]):
-    client = boto3.client("sqs", region_name="us-east-2")
-    queue_urls = client.list_queues(QueueNamePrefix="lam-shepherd")["QueueUrls"]
-    queue_url = [q for q in queue_urls if "dlq" not in q][0]
+    client = get_client("sqs", region_name="us-east-2")
+    queue_url = list_queue_pairs("lam-shepherd", region_name="us-east-2")[0].url
 
     record = {"path": "REPROCESS_URI", "kwargs": {"uri": "taxonomy-v1/company/399"}}
 
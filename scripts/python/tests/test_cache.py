@@ -0,0 +1,160 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pytest
+from utils import cache
+from utils.cache import Cache, task_definition_store
+
+ARN = "arn:aws:ecs:us-east-2:123456789012:task-definition/app:3"
+
+
+def test_task_definition_store_returns_the_same_types_on_a_hit(tmp_path):
+    definition = {
+        "taskDefinitionArn": ARN,
+        "registeredAt": datetime(2020, 1, 2, 3, 4, 5, 600000, tzinfo=timezone.utc),
+        "containerDefinitions": [{"name": "app", "environment": []}],
+    }
+    store = task_definition_store(str(tmp_path / "task_definitions.sqlite"))
+    assert store.get(ARN, lambda arn: definition) == definition
+
+    warm = task_definition_store(store.path)
+    assert warm.get(ARN, lambda arn: None) == definition
+    assert (warm.hits, warm.misses) == (1, 0)
+
+
+def test_task_definition_store_skips_unrevisioned_names(tmp_path):
+    store = task_definition_store(str(tmp_path / "task_definitions.sqlite"))
+    fetched = []
+    for _ in range(2):
+        store.get("app", lambda name: fetched.append(name) or {"family": name})
+    assert fetched == ["app", "app"]
+    assert len(store) == 0
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return clock
+
+
+def test_least_recently_used_entry_is_evicted():
+    c = Cache(maxsize=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.lookup("a")
+    c.set("c", 3)
+
+    assert c.keys() == ["a", "c"]
+    assert c.evictions == 1
+
+
+def test_ttl_expires_entries_after_they_are_stored(clock):
+    c = Cache(ttl=10)
+    c.set("a", 1)
+    clock.now += 9
+    assert c.lookup("a") == 1
+    clock.now += 1
+    assert c.lookup("a") is None
+    assert (c.hits, c.misses, c.expirations) == (1, 1, 1)
+
+
+def test_idle_ttl_is_extended_by_each_use(clock):
+    c = Cache(idle_ttl=10)
+    c.set("a", 1)
+    for _ in range(3):
+        clock.now += 9
+        assert c.lookup("a") == 1
+    clock.now += 10
+    assert "a" not in c
+
+
+def test_falsy_results_are_cached_only_with_negative_ttl(clock):
+    calls = []
+
+    def fetch(key):
+        calls.append(key)
+        return None
+
+    Cache().get("a", fetch)
+    Cache().get("a", fetch)
+    assert calls == ["a", "a"]
+
+    c = Cache(ttl=300, negative_ttl=5)
+    c.get("a", fetch)
+    c.get("a", fetch)
+    assert calls == ["a", "a", "a"]
+    clock.now += 5
+    c.get("a", fetch)
+    assert calls == ["a", "a", "a", "a"]
+
+
+def test_get_dict_leaves_out_keys_the_fetcher_did_not_return():
+    calls = []
+
+    def fetch(keys):
+        calls.append(sorted(keys))
+        return {k: k.upper() for k in keys if k != "gone"}
+
+    c = Cache(negative_ttl=60)
+    assert c.get_dict(["a", "gone"], fetch) == {"a": "A"}
+    assert c.get_dict(["a", "b", "gone"], fetch) == {"a": "A", "b": "B"}
+    assert calls == [["a", "gone"], ["b"]]
+
+
+def test_concurrent_gets_share_one_fetch():
+    c = Cache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch(key):
+        calls.append(key)
+        started.set()
+        release.wait(5)
+        return key * 2
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        first = executor.submit(c.get, "a", fetch)
+        started.wait(5)
+        others = [executor.submit(c.get, "a", fetch) for _ in range(3)]
+        release.set()
+        results = [f.result(5) for f in [first] + others]
+
+    assert results == ["aa"] * 4
+    assert calls == ["a"]
+
+
+def test_concurrent_get_dicts_fetch_each_key_once():
+    c = Cache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch(keys):
+        calls.append(sorted(keys))
+        started.set()
+        release.wait(5)
+        return {k: k.upper() for k in keys}
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first = executor.submit(c.get_dict, ["a", "b"], fetch)
+        started.wait(5)
+        second = executor.submit(c.get_dict, ["b", "c"], fetch)
+        while len(calls) < 2:
+            time.sleep(0.01)
+        release.set()
+
+    assert first.result() == {"a": "A", "b": "B"}
+    assert second.result() == {"b": "B", "c": "C"}
+    assert calls == [["a", "b"], ["c"]]
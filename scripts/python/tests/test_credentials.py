@@ -0,0 +1,50 @@
+import os
+import time
+from types import SimpleNamespace
+
+import utils.aws as aws
+
+
+def fake_credentials(access_key):
+    return SimpleNamespace(access_key=access_key, secret_key="s", token="t")
+
+
+def test_load_credentials_dates_expiry_from_the_profile_cache_file(
+    monkeypatch, tmp_path
+):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    (tmp_path / ".aws").mkdir()
+    idp_login = tmp_path / ".aws" / "credentials"
+    idp_login.write_text("[default]\n")
+    day_ago = time.time() - 24 * 60 * 60
+    os.utime(idp_login, (day_ago, day_ago))
+    hour_ago = time.time() - 60 * 60
+    cache_file = tmp_path / ".aws" / "qa.json"
+    cache_file.write_text('{"AccessKeyId": "AKIAQA"}')
+    os.utime(cache_file, (hour_ago, hour_ago))
+    monkeypatch.setattr(aws, "_credentials", {})
+    monkeypatch.setattr(
+        aws,
+        "_load_sso_credentials",
+        lambda p, f: fake_credentials("AKIAQA" if p == "qa" else "AKIAPROD"),
+    )
+
+    aws.load_credentials(["qa", "prod"], credentials_file=str(idp_login))
+
+    expires = {p: e for p, (_, e) in aws._credentials.items()}
+    assert expires["qa"] == hour_ago + aws.TEMP_CREDENTIALS_DURATION
+    # No cache file holds prod's keys, so they count as freshly loaded.
+    assert expires["prod"] > time.time() + aws.TEMP_CREDENTIALS_DURATION - 60
+
+
+def test_injected_session_keeps_the_profile_region(monkeypatch, tmp_path):
+    config_file = tmp_path / "config"
+    config_file.write_text("[profile everest-qa]\nregion = us-east-2\n")
+    monkeypatch.setenv("AWS_CONFIG_FILE", str(config_file))
+    monkeypatch.delenv("AWS_DEFAULT_REGION")
+    aws.clear_clients()
+
+    aws._inject_session("everest-qa", fake_credentials("AKIAQA"))
+
+    assert aws.get_session("everest-qa").region_name == "us-east-2"
+    aws.clear_clients()
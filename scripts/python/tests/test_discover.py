@@ -0,0 +1,170 @@
+import collections
+import threading
+import time
+
+from discover import (
+    TaskDefinitionIndex,
+    TaskInfo,
+    TaskInfoDiscoverer,
+    task_info_to_targets,
+)
+
+ACCOUNT = "arn:aws:ecs:us-east-2:123456789012"
+
+
+def task_definition(name, environment):
+    return {
+        "taskDefinitionArn": f"{ACCOUNT}:task-definition/{name}:1",
+        "containerDefinitions": [
+            {
+                "name": "app",
+                "environment": [{"name": k, "value": v} for k, v in environment],
+            }
+        ],
+    }
+
+
+def task(name, bindings, cluster="prod"):
+    return {
+        "taskArn": f"{ACCOUNT}:task/{cluster}/{name}",
+        "clusterArn": f"{ACCOUNT}:cluster/{cluster}",
+        "taskDefinitionArn": f"{ACCOUNT}:task-definition/{name}:1",
+        "containerInstanceArn": f"{ACCOUNT}:container-instance/{cluster}/ci-{name}",
+        "lastStatus": "RUNNING",
+        "group": f"service:{name}",
+        "containers": [
+            {
+                "name": "app",
+                "containerArn": f"{ACCOUNT}:container/{cluster}/{name}-app",
+                "networkBindings": [
+                    {"containerPort": c, "hostPort": h} for c, h in bindings
+                ],
+            }
+        ],
+    }
+
+
+def completed(task, definition):
+    info = TaskInfo(task)
+    info.task_definition = TaskDefinitionIndex(definition)
+    info.container_instance = {"ec2InstanceId": "i-0123"}
+    info.ec2_instance = {"PrivateIpAddress": "10.0.0.1"}
+    return info
+
+
+def test_container_ports_give_a_target_per_matching_binding():
+    definition = task_definition(
+        "web", [("PROMETHEUS", "true"), ("PROMETHEUS_CONTAINER_PORTS", "8080,9100")]
+    )
+    info = completed(
+        task("web", [(80, 32768), (8080, 32769), (9100, 32770)]), definition
+    )
+
+    targets = task_info_to_targets(info)
+
+    assert [t.port for t in targets] == ["32769", "32770"]
+    assert [t.p_instance for t in targets] == ["10.0.0.1:32769", "10.0.0.1:32770"]
+
+
+def test_first_binding_is_scraped_without_port_settings():
+    definition = task_definition("web", [("PROMETHEUS", "true")])
+    info = completed(task("web", [(80, 32768), (8080, 32769)]), definition)
+
+    assert [t.port for t in task_info_to_targets(info)] == ["32768"]
+
+
+class StubClient:
+    """Answers the ECS and EC2 calls TaskInfoDiscoverer makes from `tasks`,
+    {cluster name: [task]}, counting calls per API and argument."""
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.calls = collections.Counter()
+        self.lock = threading.Lock()
+
+    def _count(self, api, arg=None):
+        with self.lock:
+            self.calls[(api, arg)] += 1
+
+    def list_clusters(self, **kwargs):
+        self._count("list_clusters")
+        return {"clusterArns": [f"{ACCOUNT}:cluster/{c}" for c in self.tasks]}
+
+    def list_tasks(self, cluster, **kwargs):
+        self._count("list_tasks", cluster)
+        tasks = self.tasks[cluster.split("/")[-1]]
+        return {"taskArns": [t["taskArn"] for t in tasks]}
+
+    def describe_tasks(self, cluster, tasks):
+        self._count("describe_tasks", cluster)
+        listed = self.tasks[cluster.split("/")[-1]]
+        return {"tasks": [t for t in listed if t["taskArn"] in tasks]}
+
+    def describe_task_definition(self, taskDefinition):
+        self._count("describe_task_definition", taskDefinition)
+        time.sleep(0.05)  # long enough for every cluster to ask at once
+        name = taskDefinition.split("/")[-1].split(":")[0]
+        return {"taskDefinition": task_definition(name, [("PROMETHEUS", "true")])}
+
+    def describe_container_instances(self, cluster, containerInstances):
+        self._count("describe_container_instances", cluster)
+        return {
+            "containerInstances": [
+                {"containerInstanceArn": arn, "ec2InstanceId": "i-0123"}
+                for arn in containerInstances
+            ]
+        }
+
+    def describe_instances(self, InstanceIds):
+        self._count("describe_instances")
+        return {
+            "Reservations": [
+                {
+                    "Instances": [
+                        {"InstanceId": i, "PrivateIpAddress": "10.0.0.1"}
+                        for i in InstanceIds
+                    ]
+                }
+            ]
+        }
+
+
+def stub_discoverer(tasks):
+    discoverer = TaskInfoDiscoverer(max_workers=8)
+    discoverer.ecs_client = discoverer.ec2_client = StubClient(tasks)
+    return discoverer
+
+
+def test_task_definitions_are_described_once_across_clusters():
+    # Every cluster runs the same "web" definition, plus one of its own.
+    tasks = {
+        f"c{i}": [
+            task("web", [(8080, 32768)], f"c{i}"),
+            task(f"app{i}", [(8080, 32769)], f"c{i}"),
+        ]
+        for i in range(6)
+    }
+    discoverer = stub_discoverer(tasks)
+
+    infos = discoverer.get_infos()
+
+    calls = discoverer.ecs_client.calls
+    assert len(infos) == 12
+    assert calls[("describe_task_definition", f"{ACCOUNT}:task-definition/web:1")] == 1
+    assert (
+        sum(n for (api, _), n in calls.items() if api == "describe_task_definition")
+        == 7
+    )
+
+
+def test_removed_tasks_are_forgotten():
+    tasks = {"prod": [task("web", [(8080, 32768)]), task("api", [(8080, 32769)])]}
+    discoverer = stub_discoverer(tasks)
+    discoverer.get_infos()
+    removed = tasks["prod"].pop()
+
+    infos = discoverer.get_infos()
+
+    assert [i.task["taskArn"] for i in infos] == [tasks["prod"][0]["taskArn"]]
+    assert removed["taskArn"] not in discoverer.task_cache
+    assert discoverer.task_changes == {"added": 0, "removed": 1}
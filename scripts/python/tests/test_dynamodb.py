@@ -0,0 +1,28 @@
+from moto import mock_aws
+from utils.aws import clear_clients, dynamodb
+
+TABLE = {
+    "TableName": "alerts",
+    "AttributeDefinitions": [
+        {"AttributeName": "uri", "AttributeType": "S"},
+        {"AttributeName": "timestamp", "AttributeType": "S"},
+    ],
+    "KeySchema": [
+        {"AttributeName": "uri", "KeyType": "HASH"},
+        {"AttributeName": "timestamp", "KeyType": "RANGE"},
+    ],
+}
+
+
+@mock_aws
+def test_batch_writer_keeps_last_write_per_key():
+    clear_clients()
+    dynamodb.create_tables([TABLE])
+    items = [{"uri": f"u{i % 5}", "timestamp": "t", "n": i} for i in range(30)]
+
+    writer = dynamodb.BatchWriter("alerts")
+    assert writer.put(items) == []
+
+    stored = sorted(dynamodb.parallel_scan("alerts"), key=lambda i: i["uri"])
+    assert [int(i["n"]) for i in stored] == [25, 26, 27, 28, 29]
+    assert (writer.stats.batches, writer.stats.sent) == (1, 5)
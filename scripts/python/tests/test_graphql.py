@@ -0,0 +1,95 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+from utils import graphql
+from utils.exceptions import GraphQLError
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answers `{ echo }` with the query, `{ bad }` with a GraphQL error,
+    `{ broken }` with a 500, and `{ flaky }` with one 503 before succeeding."""
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)["query"][0]
+        with self.server.lock:
+            self.server.requests.append(query)
+            attempt = self.server.requests.count(query)
+        if query == "{ bad }":
+            self.reply(400, {"errors": [{"message": "bad field"}]})
+        elif query == "{ broken }":
+            self.reply(500, {})
+        elif query == "{ flaky }" and attempt == 1:
+            self.reply(503, {})
+        else:
+            self.reply(200, {"data": {"query": query}})
+
+    def reply(self, status, body):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_port}/graphql"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    graphql.clear_cache()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_cached_responses_are_reused_and_not_shared(server):
+    first = graphql.query_graphql("{  echo }", server.url, cache_ttl=60)
+    first["data"]["query"] = "mutated"
+    second = graphql.query_graphql("{ echo  }", server.url, cache_ttl=60)
+
+    assert second == {"data": {"query": "{ echo }"}}
+    assert server.requests == ["{ echo }"]
+
+
+def test_responses_are_not_cached_without_ttl(server):
+    graphql.query_graphql("{ echo }", server.url)
+    graphql.query_graphql("{ echo }", server.url)
+
+    assert server.requests == ["{ echo }", "{ echo }"]
+
+
+def test_unavailable_responses_are_retried(server):
+    assert graphql.query_graphql("{ flaky }", server.url) == {
+        "data": {"query": "{ flaky }"}
+    }
+    assert server.requests == ["{ flaky }", "{ flaky }"]
+
+
+def test_graphql_errors_raise_and_are_not_cached(server):
+    for _ in range(2):
+        with pytest.raises(GraphQLError, match="bad field"):
+            graphql.query_graphql("{ bad }", server.url, cache_ttl=60)
+    assert server.requests == ["{ bad }", "{ bad }"]
+
+
+def test_other_statuses_raise_request_exception(server):
+    with pytest.raises(requests.exceptions.RequestException, match="500"):
+        graphql.query_graphql("{ broken }", server.url)
+
+
+def test_query_graphql_many_keeps_order(server):
+    queries = [f"{{ echo{i} }}" for i in range(20)]
+
+    responses = graphql.query_graphql_many(queries, server.url, max_workers=8)
+
+    assert [r["data"]["query"] for r in responses] == queries
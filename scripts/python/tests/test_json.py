@@ -0,0 +1,49 @@
+import json
+from decimal import Decimal
+from enum import Enum
+
+import pytest
+from utils import AutoEncoder, dumps
+
+
+class Flow(Enum):
+    ENTRY = "product-entry"
+
+
+class Kind(str, Enum):
+    A = "a"
+
+
+class Uri:
+    def __init__(self, uri):
+        self.uri = uri
+
+    def _json(self):
+        return {"uri": self.uri}
+
+
+@pytest.mark.parametrize(
+    "obj",
+    [
+        {"b": [1, 2.5, None, True], "a": "café ☃ </>"},
+        "\x7f",
+        {"del": "a\x7fb"},
+        1e-7,
+        [1e-07, 1e100, -0.0, 2**70],
+        float("nan"),
+        Flow.ENTRY,
+        Kind.A,
+        {"asset": Uri("asset:1"), "flow": Flow.ENTRY},
+        {1: "int key", "2": "str key"},
+        Decimal("1.1"),
+        {(1, 2): "tuple key"},
+    ],
+)
+def test_dumps_matches_stdlib(obj):
+    try:
+        expected = json.dumps(obj, sort_keys=True, cls=AutoEncoder)
+    except TypeError:
+        with pytest.raises(TypeError):
+            dumps(obj)
+    else:
+        assert dumps(obj) == expected
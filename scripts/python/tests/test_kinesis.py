@@ -0,0 +1,101 @@
+import pytest
+from moto import mock_aws
+from utils.aws import clear_clients, get_client, kinesis
+
+
+class ThrottlingClient:
+    """Wrap a kinesis client so put_records fails the second record of the
+    first batch with a throughput error on the first `times` calls."""
+
+    def __init__(self, client, times=1):
+        self.client = client
+        self.times = times
+        self.calls = 0
+        self.throttled = None
+
+    def put_records(self, StreamName, Records):
+        self.calls += 1
+        if self.throttled is None:
+            self.throttled = Records[1]["PartitionKey"]
+        if self.calls > self.times:
+            return self.client.put_records(StreamName=StreamName, Records=Records)
+        sent = [r for r in Records if r["PartitionKey"] != self.throttled]
+        results = iter(
+            self.client.put_records(StreamName=StreamName, Records=sent)["Records"]
+            if sent
+            else []
+        )
+        return {
+            "FailedRecordCount": 1,
+            "Records": [
+                (
+                    {
+                        "ErrorCode": "ProvisionedThroughputExceededException",
+                        "ErrorMessage": "Rate exceeded for shard",
+                    }
+                    if r["PartitionKey"] == self.throttled
+                    else next(results)
+                )
+                for r in Records
+            ],
+        }
+
+
+@pytest.fixture
+def stream():
+    with mock_aws():
+        clear_clients()
+        client = get_client("kinesis")
+        client.create_stream(StreamName="outcomes", ShardCount=4)
+        yield client
+
+
+def test_put_batch_resubmits_records_with_an_error_code(stream):
+    client = ThrottlingClient(stream)
+    producer = kinesis.KinesisProducer("outcomes", client=client)
+
+    (response,) = producer.send([{"n": n} for n in range(3)])
+
+    assert client.calls == 2
+    assert response["FailedRecordCount"] == 0
+    assert all("SequenceNumber" in r for r in response["Records"])
+    assert (producer.stats.sent, producer.stats.failed, producer.stats.retried) == (
+        3,
+        0,
+        1,
+    )
+
+
+def test_put_batch_reports_records_still_failing_after_max_attempts(stream):
+    client = ThrottlingClient(stream, times=2)
+    producer = kinesis.KinesisProducer("outcomes", client=client, max_attempts=2)
+
+    (response,) = producer.send([{"n": n} for n in range(3)])
+
+    assert response["FailedRecordCount"] == 1
+    assert "ErrorCode" in response["Records"][1]
+    assert (producer.stats.sent, producer.stats.failed) == (2, 1)
+
+
+def test_shard_limiter_maps_partition_keys_like_kinesis(stream):
+    limiter = kinesis.ShardLimiter.for_stream(stream, "outcomes")
+    records = [kinesis.build({"n": n}) for n in range(50)]
+
+    response = stream.put_records(StreamName="outcomes", Records=records)
+
+    assert [r["ShardId"] for r in response["Records"]] == [
+        limiter.shard_for(r["PartitionKey"]) for r in records
+    ]
+
+
+def test_shard_limiter_waits_once_a_shard_is_over_its_limit(monkeypatch):
+    shard = {"ShardId": "shard-0", "HashKeyRange": {"StartingHashKey": "0"}}
+    limiter = kinesis.ShardLimiter([shard], records_per_second=10)
+    slept = []
+    monkeypatch.setattr(kinesis.time, "sleep", slept.append)
+    records = [kinesis.build({"n": n}) for n in range(10)]
+
+    limiter.acquire(records)
+    assert slept == []
+    limiter.acquire(records)
+    assert slept == [pytest.approx(1.0, abs=0.05)]
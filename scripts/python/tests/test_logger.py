@@ -0,0 +1,15 @@
+import json
+
+from utils.logger import Logger
+
+
+def test_context_accepts_duration_from_the_caller_and_restores_state():
+    lines = []
+    log = Logger(sink=lines.append, service="discover")
+
+    with log.context("work", bind={"job": 1}) as on_the_fly:
+        on_the_fly["duration"] = 5
+
+    finish = json.loads(lines[-1])
+    assert finish["event"] == "finish:work" and finish["duration"] == 5
+    assert log._context == {"service": "discover"}
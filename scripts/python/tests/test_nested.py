@@ -0,0 +1,36 @@
+from collections import defaultdict
+
+import pytest
+from utils import NestedPath, get_nested
+
+
+def _result(fn):
+    try:
+        return fn()
+    except TypeError:
+        return TypeError
+
+
+@pytest.mark.parametrize(
+    "d, keys",
+    [
+        ({"a": {"b": 1}}, ["a", "b"]),
+        ({"a": {"b": 0}}, ["a", "b"]),
+        ({}, ["a", "b"]),
+        ({"a": None}, ["a", "b"]),
+        ({"a": [1, 2]}, ["a", 0]),
+        ({"a": "xyz"}, ["a", 1]),
+        ({"a": [{"x": 1}]}, ["a", "x"]),
+    ],
+)
+def test_nested_path_matches_get_nested(d, keys):
+    path = NestedPath(keys)
+    expected = _result(lambda: get_nested(d, keys))
+    assert _result(lambda: path.get(d)) == expected
+    assert _result(lambda: path.get_many([d])) in (expected, [expected])
+
+
+def test_nested_path_does_not_insert_into_defaultdict():
+    d = defaultdict(dict)
+    assert NestedPath("a.b").get(d) == {}
+    assert dict(d) == {}
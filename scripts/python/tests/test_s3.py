@@ -0,0 +1,61 @@
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+from utils.aws import clear_clients, get_client, s3
+
+
+@pytest.fixture
+def client():
+    with mock_aws():
+        clear_clients()
+        yield get_client("s3")
+
+
+@pytest.mark.parametrize("versioned", [False, True])
+def test_empty_bucket_spanning_several_pages(client, versioned):
+    client.create_bucket(Bucket="teardown")
+    if versioned:
+        client.put_bucket_versioning(
+            Bucket="teardown", VersioningConfiguration={"Status": "Enabled"}
+        )
+    for i in range(2500):
+        client.put_object(Bucket="teardown", Key=f"k{i:05d}", Body=b"x")
+    if versioned:
+        # Extra versions and delete markers push the listing past 3 pages.
+        for i in range(600):
+            client.put_object(Bucket="teardown", Key=f"k{i:05d}", Body=b"y")
+        client.delete_objects(
+            Bucket="teardown",
+            Delete={"Objects": [{"Key": f"k{i:05d}"} for i in range(300)]},
+        )
+
+    assert s3.empty_bucket("teardown", versions=versioned) == []
+
+    assert client.list_objects_v2(Bucket="teardown")["KeyCount"] == 0
+    versions = client.list_object_versions(Bucket="teardown")
+    assert not versions.get("Versions") and not versions.get("DeleteMarkers")
+    s3.delete_bucket("teardown")
+
+
+def test_download_objects_skips_folder_placeholders(client, tmp_path):
+    client.create_bucket(Bucket="packages")
+    client.put_object(Bucket="packages", Key="prod/", Body=b"")
+    client.put_object(Bucket="packages", Key="prod/a.whl", Body=b"wheel")
+
+    stats = s3.download_objects("packages", tmp_path, client=client)
+
+    assert stats.sent == 1 and stats.failed == 0
+    assert (tmp_path / "prod" / "a.whl").read_bytes() == b"wheel"
+
+
+def test_bucket_exists_raises_errors_other_than_not_found(client, monkeypatch):
+    client.create_bucket(Bucket="present")
+    assert s3.bucket_exists("present")
+    assert not s3.bucket_exists("absent")
+
+    def forbidden(**kwargs):
+        raise ClientError({"Error": {"Code": "403"}}, "HeadBucket")
+
+    monkeypatch.setattr(client, "head_bucket", forbidden)
+    with pytest.raises(ClientError):
+        s3.bucket_exists("present")
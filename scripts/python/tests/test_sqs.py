@@ -0,0 +1,80 @@
+import pytest
+from moto import mock_aws
+from utils.aws import clear_clients, get_client, sqs
+
+
+class FlakyClient:
+    """Wrap an sqs client so the first send fails one entry permanently and
+    one entry transiently."""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = 0
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.calls += 1
+        if self.calls > 1:
+            return self.client.send_message_batch(QueueUrl=QueueUrl, Entries=Entries)
+        permanent, transient, *rest = Entries
+        response = self.client.send_message_batch(QueueUrl=QueueUrl, Entries=rest)
+        response["Failed"] = [
+            {"Id": permanent["Id"], "SenderFault": True, "Code": "InvalidParameter"},
+            {"Id": transient["Id"], "SenderFault": False, "Code": "InternalError"},
+        ]
+        return response
+
+
+@mock_aws
+def test_send_batch_reports_sender_faults_from_every_attempt():
+    clear_clients()
+    url = sqs.create_queue("retry-accounting")
+    client = FlakyClient(get_client("sqs"))
+    sender = sqs.SQSSender(url, client=client)
+
+    (response,) = sender.send([{"n": n} for n in range(3)])
+
+    assert client.calls == 2
+    assert len(response["Successful"]) == 2
+    assert [f["Code"] for f in response["Failed"]] == ["InvalidParameter"]
+    assert (sender.stats.sent, sender.stats.failed, sender.stats.retried) == (2, 1, 1)
+    messages = get_client("sqs").receive_message(QueueUrl=url, MaxNumberOfMessages=10)
+    assert len(messages["Messages"]) == 2
+
+
+@mock_aws
+def test_reused_queue_is_empty_when_yielded():
+    clear_clients()
+    url = sqs.create_queue("reused")
+    sqs.batch_put_messages(url, [{"n": n} for n in range(25)])
+
+    fixture = sqs.create_then_destroy(["reused"], reuse=True)
+    assert next(fixture) == {"reused": url}
+    assert sqs._queue_depth(url) == 0
+    fixture.close()
+
+
+@mock_aws
+def test_get_queue_url_remembers_missing_queues_until_created():
+    clear_clients()
+    client = get_client("sqs")
+    with pytest.raises(client.exceptions.QueueDoesNotExist):
+        sqs.get_queue_url("late")
+    client.create_queue(QueueName="late")
+    with pytest.raises(client.exceptions.QueueDoesNotExist):
+        sqs.get_queue_url("late")
+
+    url = sqs.create_queue("late")
+
+    assert sqs.get_queue_url("late") == url
+
+
+@mock_aws
+def test_get_queue_url_is_cached_per_credentials(monkeypatch, tmp_path):
+    clear_clients()
+    url = sqs.create_queue("shared-name")
+    assert sqs.get_queue_url("shared-name") == url
+    monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", str(tmp_path / "other"))
+
+    key = sqs._cache_key(get_client("sqs"), "shared-name")
+
+    assert key not in sqs._queue_urls
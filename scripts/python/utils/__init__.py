@@ -1,9 +1,12 @@
 import base64
+import functools
 import hashlib
 import importlib
+import itertools
 import json
 import logging
 import os
+import re
 import shlex
 import sys
 from collections import namedtuple
@@ -14,19 +17,91 @@ from pathlib import Path
 import requests
 
 
-def hash(encoded_data):
-    return hashlib.sha1(encoded_data.encode("utf-8")).hexdigest()
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+def _blake2b(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+HASH_ALGORITHMS = {
+    "sha1": lambda data: hashlib.sha1(data).hexdigest(),
+    "blake2b": _blake2b,
+}
+if xxhash:
+    HASH_ALGORITHMS["xxhash"] = lambda data: xxhash.xxh3_128_hexdigest(data)
+
+
+def hash(encoded_data, algorithm="sha1"):
+    """Hex digest of a str or bytes payload.
+
+    Args:
+        encoded_data (str|bytes): Payload; str is encoded as utf-8.
+        algorithm (str): One of HASH_ALGORITHMS. "xxhash" is only available
+            when the xxhash package is installed, and falls back to "blake2b".
+
+    """
+    if isinstance(encoded_data, str):
+        encoded_data = encoded_data.encode("utf-8")
+    if algorithm == "xxhash" and not xxhash:
+        algorithm = "blake2b"
+    return HASH_ALGORITHMS[algorithm](encoded_data)
 
 
 def batch(iterable, n=1):
     """Batch iterator.
 
-    https://stackoverflow.com/a/8290508
+    Consumes any iterable lazily (lists, generators, paginators, cursors) and
+    yields lists of at most `n` items, so only one batch is held in memory.
+
+    """
+    if n < 1:
+        raise ValueError(f"batch size must be at least 1, got {n}")
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, n))
+        if not chunk:
+            return
+        yield chunk
+
+
+def batch_by_size(iterable, max_bytes, n=None, size=len):
+    """Batch iterator bounded by total payload size as well as item count.
+
+    Args:
+        iterable: Any iterable of items.
+        max_bytes (int): Maximum sum of `size(item)` in a single batch.
+        n (int, optional): Maximum number of items in a single batch.
+        size (callable): Returns the size in bytes of an item.
+
+    Raises:
+        ValueError: If a single item is larger than `max_bytes`.
 
     """
-    iter_len = len(iterable)
-    for ndx in range(0, iter_len, n):
-        yield iterable[ndx : min(ndx + n, iter_len)]
+    chunk = []
+    chunk_bytes = 0
+    for item in iterable:
+        item_bytes = size(item)
+        if item_bytes > max_bytes:
+            raise ValueError(
+                f"item of {item_bytes} bytes exceeds batch limit of {max_bytes} bytes"
+            )
+        if chunk and (chunk_bytes + item_bytes > max_bytes or (n and len(chunk) >= n)):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(item)
+        chunk_bytes += item_bytes
+    if chunk:
+        yield chunk
 
 
 def get_nested(d, keys):
@@ -52,6 +127,56 @@ def set_nested(d, keys, value):
     d[keys[-1]] = value
 
 
+class NestedPath:
+    """A key path parsed once and applied to many dictionaries.
+
+    Equivalent to `get_nested(d, keys)` / `set_nested(d, keys, value)`. Levels
+    that are plain dicts are read with a direct `head[k]`; any other level
+    (dict subclasses such as defaultdict, objects read by attribute) is
+    handed to `get_nested` for the rest of the path.
+
+    Args:
+        keys (str|list): e.g. "ResponseMetadata.HTTPStatusCode" or
+            ["ResponseMetadata", "HTTPStatusCode"].
+
+    """
+
+    def __init__(self, keys):
+        self.keys = tuple(keys.split(".") if isinstance(keys, str) else keys)
+        if not self.keys:
+            raise ValueError("NestedPath requires at least one key")
+
+    def get(self, d):
+        head = d
+        for i, k in enumerate(self.keys):
+            if type(head) is not dict:
+                return get_nested(head, self.keys[i:])
+            try:
+                head = head[k]
+            except KeyError:
+                return {}
+            if not head:
+                return head
+        return head
+
+    def get_many(self, records):
+        """Extract this path from every record, returning a list."""
+        get = self.get
+        return [get(r) for r in records]
+
+    def set(self, d, value):
+        set_nested(d, self.keys, value)
+
+    def __repr__(self):
+        return f"NestedPath<{'.'.join(map(str, self.keys))}>"
+
+
+@functools.lru_cache(maxsize=256)
+def compile_path(keys):
+    """Return a cached NestedPath for a dotted string or tuple of keys."""
+    return NestedPath(keys)
+
+
 def _set_env(env):
     state = {}
     for k, v in env.items():
@@ -92,11 +217,76 @@ def emit_logs(body, logger=None):
         logger.log(level=logging.INFO, msg=body)
 
 
+def _auto_default(obj):
+    if isinstance(obj, Enum):
+        return str(obj)
+    try:
+        return obj._json()
+    except AttributeError:
+        raise TypeError(
+            f"Object of type {obj.__class__.__name__} is not JSON serializable"
+        )
+
+
 class AutoEncoder(json.JSONEncoder):
     def default(self, obj):
+        return _auto_default(obj)
+
+
+# ujson writes 1e-7 where json writes 1e-07; payloads containing such
+# floats go through the stdlib encoder so output stays byte-identical.
+_SHORT_EXPONENT = re.compile(r"\de-\d(?!\d)")
+
+# Exact types ujson encodes the same way as the stdlib. Anything else,
+# including subclasses, Enum/_json objects and Decimal (which ujson accepts
+# but json rejects), is left to the stdlib encoder.
+_PLAIN_SCALARS = frozenset([str, int, float, bool, type(None)])
+
+# One reusable instance, rather than json.dumps building an encoder per call.
+_encode = AutoEncoder(sort_keys=True).encode
+
+if ujson:
+    _ujson_dumps = functools.partial(
+        ujson.dumps,
+        sort_keys=True,
+        ensure_ascii=True,
+        escape_forward_slashes=False,
+        separators=(", ", ": "),
+    )
+
+
+def _is_plain(obj):
+    t = type(obj)
+    if t in _PLAIN_SCALARS:
+        return True
+    if t is dict:
+        for k, v in obj.items():
+            if type(k) is not str or not _is_plain(v):
+                return False
+        return True
+    if t is list or t is tuple:
+        for v in obj:
+            if not _is_plain(v):
+                return False
+        return True
+    return False
+
+
+def dumps(obj):
+    """Canonical JSON: identical to json.dumps(obj, sort_keys=True, cls=AutoEncoder).
+
+    Uses ujson for payloads made only of plain JSON types when it is
+    installed, falling back to the stdlib encoder for anything else and for
+    output ujson does not write the same way.
+    """
+    if ujson:
         try:
-            if isinstance(obj, Enum):
-                return str(obj)
-            return obj._json()
-        except AttributeError:
-            return json.JSONEncoder.default(self, obj)
+            if _is_plain(obj):
+                data = _ujson_dumps(obj)
+                if "\x7f" not in data and (
+                    "e-" not in data or not _SHORT_EXPONENT.search(data)
+                ):
+                    return data
+        except (TypeError, ValueError, OverflowError, RecursionError):
+            pass
+    return _encode(obj)
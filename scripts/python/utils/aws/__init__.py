@@ -1,3 +1,4 @@
+import collections
 import configparser
 import contextlib
 import getpass
@@ -9,19 +10,100 @@ import re
 import subprocess
 import sys
 import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
 from unittest import mock
 
 import aws_sso
 import backoff
+import boto3
+import botocore.config
 import urllib3
-from botocore.exceptions import ClientError, NoCredentialsError
+from botocore.exceptions import ClientError, NoCredentialsError, ProfileNotFound
 
 from .. import *
 
 TEMP_CREDENTIALS_DURATION = 8 * 60 * 60  # 8 hours
 
+_sessions = {}
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _session_key(profile_name=None):
+    return (
+        profile_name or os.environ.get("AWS_PROFILE"),
+        os.environ.get("AWS_SHARED_CREDENTIALS_FILE"),
+    )
+
+
+def get_session(profile_name=None):
+    """Return a cached boto3 Session for a profile and the active credentials file."""
+    key = _session_key(profile_name)
+    with _clients_lock:
+        if key not in _sessions:
+            _sessions[key] = boto3.session.Session(profile_name=key[0])
+        return _sessions[key]
+
+
+def get_client(
+    service_name, region_name=None, profile_name=None, max_pool_connections=None
+):
+    """Return a cached boto3 client.
+
+    Clients are keyed by service, region, profile and the active
+    AWS_SHARED_CREDENTIALS_FILE, so they are rebuilt when `auth` swaps
+    credentials. boto3 clients are thread-safe and can be shared by workers.
+
+    Args:
+        service_name (str): e.g. "sqs"
+        region_name (str, optional): Defaults to boto3's region resolution.
+        profile_name (str, optional): Defaults to AWS_PROFILE.
+        max_pool_connections (int, optional): Size of the HTTP connection pool;
+            raise it above the botocore default of 10 for wide thread pools.
+
+    """
+    region_name = region_name or os.environ.get("AWS_DEFAULT_REGION")
+    key = (service_name, region_name, max_pool_connections) + _session_key(profile_name)
+    client = _clients.get(key)
+    if client is None:
+        session = get_session(profile_name)
+        client_config = (
+            botocore.config.Config(max_pool_connections=max_pool_connections)
+            if max_pool_connections
+            else None
+        )
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = session.client(
+                    service_name, region_name=region_name, config=client_config
+                )
+                _clients[key] = client
+    return client
+
+
+def clear_clients(credentials_file=None):
+    """Drop cached sessions and clients.
+
+    Args:
+        credentials_file (str, optional): Only drop those built from this
+            AWS_SHARED_CREDENTIALS_FILE; all of them if None.
+
+    """
+    with _clients_lock:
+        if credentials_file is None:
+            _sessions.clear()
+            _clients.clear()
+            return
+        for key in [k for k in _sessions if k[1] == credentials_file]:
+            del _sessions[key]
+        for key in [k for k in _clients if k[-1] == credentials_file]:
+            del _clients[key]
+
 
 # @backoff.on_exception(
 #     backoff.expo, pytest_localstack.exceptions.TimeoutError, max_tries=3
@@ -35,19 +117,217 @@ def backoff_check(func):
     return func()
 
 
+def backoff_sleep(attempt, base=0.1, cap=5):
+    """Sleep for a jittered exponential delay before retry number `attempt`."""
+    time.sleep(min(base * 2**attempt, cap) * random.uniform(0.5, 1.5))
+
+
+def thread_map(func, items, max_workers=8):
+    """Map `func` over a lazily consumed iterable on a thread pool.
+
+    At most `max_workers` calls are in flight; results are yielded in input order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = collections.deque()
+        for item in items:
+            if len(in_flight) >= max_workers:
+                yield in_flight.popleft().result()
+            in_flight.append(executor.submit(func, item))
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def wait_all(ready, names, delay=1, timeout=60, max_workers=8):
+    """Poll `ready(name)` for every name in one loop until all are true.
+
+    Each round checks the remaining names concurrently and then sleeps once,
+    so waiting on many resources costs about as much as waiting on one.
+    Raises TimeoutError naming whatever is still pending after `timeout`.
+    """
+    pending = list(names)
+    deadline = time.time() + timeout
+    while pending:
+        pending = [
+            n
+            for n, ok in zip(pending, thread_map(ready, pending, max_workers))
+            if not ok
+        ]
+        if pending:
+            if time.time() > deadline:
+                raise TimeoutError(f"Timed out waiting for {pending}")
+            time.sleep(delay)
+
+
+class SendStats:
+    """Counters for a batch sender, safe to update from worker threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.start = time.time()
+        self.end = None
+
+    def update(self, **counts):
+        with self._lock:
+            for k, v in counts.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    @property
+    def elapsed(self):
+        return (self.end or time.time()) - self.start
+
+    @property
+    def throughput(self):
+        """Items sent per second."""
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return (
+            f"SendStats<sent={self.sent} failed={self.failed} retried={self.retried} "
+            f"batches={self.batches} elapsed={self.elapsed:.2f}s "
+            f"throughput={self.throughput:.1f}/s>"
+        )
+
+
 def check_status(response, code=2, keys=["ResponseMetadata", "HTTPStatusCode"]):
     """Check status of an AWS API response."""
-    status = get_nested(response, keys)
+    status = compile_path(tuple(keys)).get(response)
     assert status // 100 == code
     return status
 
 
+_credentials = {}
+_injected = {}
+_credentials_lock = threading.Lock()
+
+
+def _prune_cached_credentials(expire_threshold):
+    expire_threshold += time.time()
+    for cache_credentials_path in (Path.home() / ".aws").glob("*.json"):
+        c_stat = cache_credentials_path.stat()
+        if c_stat.st_mtime + TEMP_CREDENTIALS_DURATION < expire_threshold:
+            cache_credentials_path.unlink()
+
+
+def _sso_credentials_loaded_at(creds):
+    """mtime of the SSO cache file holding `creds`, or None if none does.
+
+    The shared credentials file itself only holds long-lived IDP login info,
+    so its age says nothing about when `creds` were issued.
+    """
+    for path in (Path.home() / ".aws").glob("*.json"):
+        try:
+            if creds.access_key in path.read_text():
+                return path.stat().st_mtime
+        except OSError:
+            continue
+    return None
+
+
+def _credentials_expiry(creds, loaded_at):
+    """When `creds` expire: their own expiry time if they carry one, otherwise
+    TEMP_CREDENTIALS_DURATION after `loaded_at`."""
+    expiry = getattr(creds, "_expiry_time", None) or getattr(creds, "expiry_time", None)
+    if isinstance(expiry, datetime):
+        return expiry.timestamp()
+    return loaded_at + TEMP_CREDENTIALS_DURATION
+
+
+def _load_sso_credentials(profile, credentials_file):
+    return aws_sso.credentials.MintelSSOSharedCredentialProvider(
+        profile_name=profile,
+        creds_filename=credentials_file,
+        account_hint=profile,
+        duration=TEMP_CREDENTIALS_DURATION,
+    ).load()
+
+
+def load_credentials(
+    profiles, credentials_file="~/.aws/credentials", expire_threshold=1200
+):
+    """Return {profile: credentials}, reusing credentials cached in this process.
+
+    Only profiles whose cached credentials are missing or expire within
+    `expire_threshold` seconds are loaded again. Those are loaded from the
+    SSO credentials file concurrently; any still missing are then prompted
+    for one at a time.
+    """
+    now = time.time()
+    with _credentials_lock:
+        cached = {
+            p: _credentials[p]
+            for p in profiles
+            if p in _credentials and _credentials[p][1] - now > expire_threshold
+        }
+    stale = [p for p in profiles if p not in cached]
+    if stale:
+        _prune_cached_credentials(expire_threshold)
+        loaded = dict(
+            zip(
+                stale,
+                thread_map(lambda p: _load_sso_credentials(p, credentials_file), stale),
+            )
+        )
+        for profile in stale:
+            creds = loaded[profile]
+            if creds is not None:
+                # Credentials read from an SSO cache file may be hours old.
+                loaded_at = _sso_credentials_loaded_at(creds) or now
+                expires = _credentials_expiry(creds, loaded_at)
+            else:
+                creds = aws_sso.credentials.PromptAllProvider(
+                    account_hint=profile, duration=TEMP_CREDENTIALS_DURATION
+                ).load()
+                expires = _credentials_expiry(creds, time.time())
+            if creds is None:
+                raise Exception("credentials for profile %s not found" % (profile,))
+            cached[profile] = (creds, expires)
+        with _credentials_lock:
+            _credentials.update((p, cached[p]) for p in stale)
+    return {p: cached[p][0] for p in profiles}
+
+
+def _profile_region(profile):
+    """The region configured for `profile`, or None."""
+    try:
+        return boto3.session.Session(profile_name=profile).region_name
+    except ProfileNotFound:
+        return None
+
+
+def _inject_session(profile, creds):
+    """Cache a boto3 Session built from `creds` as the session for `profile`."""
+    key = _session_key(profile)
+    with _clients_lock:
+        if key in _sessions and _injected.get(key) is creds:
+            return
+        _sessions[key] = boto3.session.Session(
+            aws_access_key_id=creds.access_key,
+            aws_secret_access_key=creds.secret_key,
+            aws_session_token=creds.token,
+            region_name=_profile_region(profile),
+        )
+        _injected[key] = creds
+        for client_key in [k for k in _clients if k[3:] == key]:
+            del _clients[client_key]
+
+
 @contextlib.contextmanager
-def auth(profiles, credentials_file="~/.aws/credentials", expire_threshold=1200):
+def auth(
+    profiles,
+    credentials_file="~/.aws/credentials",
+    expire_threshold=1200,
+    inject=False,
+):
     """Context manager to auth multiple AWS accounts.
 
     Dumps temporary credentials into a temporary file and
     sets the AWS_SHARED_CREDENTIALS_FILE environment variable.
+    Credentials are cached per profile in-process, so entering this
+    again only reloads profiles that are about to expire.
 
     Args:
         profiles (list[str]): List of profile names in the AWS credentials file.
@@ -56,33 +336,21 @@ def auth(profiles, credentials_file="~/.aws/credentials", expire_threshold=1200)
         expire_threshold (int): Cached credentials expiring during Terraform apply
             can cause headaches. Cached credentials with fewer than `expire_threshold`
             seconds left to expiration will be deleted.
+        inject (bool): Skip the temporary file and put the credentials straight
+            into the cached sessions used by `get_client`. Those sessions and
+            their clients stay cached after the block exits.
 
     """
-    expire_threshold += time.time()
-    for cache_credentials_path in (Path.home() / ".aws").glob("*.json"):
-        c_stat = cache_credentials_path.stat()
-        if c_stat.st_mtime + TEMP_CREDENTIALS_DURATION < expire_threshold:
-            cache_credentials_path.unlink()
+    credentials = load_credentials(profiles, credentials_file, expire_threshold)
+    if inject:
+        with set_env({"AWS_PROFILE": profiles[0]}):
+            for profile, creds in credentials.items():
+                _inject_session(profile, creds)
+            yield
+        return
 
     config = configparser.RawConfigParser()
-    for profile in profiles:
-        providers = [
-            aws_sso.credentials.MintelSSOSharedCredentialProvider(
-                profile_name=profile,
-                creds_filename=credentials_file,
-                account_hint=profile,
-                duration=TEMP_CREDENTIALS_DURATION,
-            ),
-            aws_sso.credentials.PromptAllProvider(
-                account_hint=profile, duration=TEMP_CREDENTIALS_DURATION
-            ),
-        ]
-        for provider in providers:
-            creds = provider.load()
-            if creds is not None:
-                break
-        if creds is None:
-            raise Exception("credentials for profile %s not found" % (profile,))
+    for profile, creds in credentials.items():
         config.add_section(profile)
         config.set(profile, "aws_access_key_id", creds.access_key)
         config.set(profile, "aws_secret_access_key", creds.secret_key)
@@ -96,4 +364,9 @@ def auth(profiles, credentials_file="~/.aws/credentials", expire_threshold=1200)
                 "AWS_PROFILE": profiles[0],
             }
         ):
-            yield
+            try:
+                yield
+            finally:
+                # The temp credentials file is about to disappear; clients
+                # injected for other profiles are left alone.
+                clear_clients(os.path.abspath(temp_f.name))
@@ -0,0 +1,264 @@
+"""asyncio variants of the utils.aws helpers.
+
+Calls go through `AsyncClient`, an aiobotocore-style wrapper
+(`await client.list_queues(...)`) around the cached, thread-safe boto3
+clients. Each call runs on the client's own thread pool, and an
+asyncio.Semaphore bounds how many are in flight, so fan-out across
+hundreds of queues, streams, buckets or tables stays within the HTTP
+connection pool. This needs no extra dependency and works under moto.
+"""
+
+import asyncio
+import contextlib
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+import botocore
+from decouple import config
+from utils.aws import get_client
+
+from . import dynamodb, kinesis, s3, sqs
+
+
+class AsyncClient:
+    """Awaitable wrapper around a cached boto3 client.
+
+    Args:
+        service_name (str): e.g. "sqs"
+        concurrency (int): Maximum number of calls in flight.
+        region_name (str, optional): Defaults to boto3's region resolution.
+        client (optional): boto3 client to wrap instead of the cached one.
+
+    """
+
+    def __init__(self, service_name, concurrency=16, region_name=None, client=None):
+        self.concurrency = concurrency
+        self.client = (
+            client
+            if client
+            else get_client(
+                service_name,
+                region_name=region_name,
+                max_pool_connections=concurrency,
+            )
+        )
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking callable on this client's pool, within the concurrency bound."""
+        if self._semaphore is None:
+            # Created lazily so it binds to the running event loop.
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(func, *args, **kwargs)
+            )
+
+    async def paginate(self, operation_name, **kwargs):
+        """Async generator over the pages of a paginated operation."""
+        pages = iter(self.client.get_paginator(operation_name).paginate(**kwargs))
+        while True:
+            page = await self.run(next, pages, None)
+            if page is None:
+                return
+            yield page
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        async def call(**kwargs):
+            return await self.run(method, **kwargs)
+
+        return call
+
+
+async def bounded_map(func, items, concurrency=16):
+    """Await `func(item)` for every item with at most `concurrency` pending.
+
+    `items` is consumed lazily; results are returned in input order.
+    """
+    results = []
+    pending = set()
+    try:
+        for i, item in enumerate(items):
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                results.extend(t.result() for t in done)
+            pending.add(asyncio.ensure_future(_indexed(i, func(item))))
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_EXCEPTION
+            )
+            results.extend(t.result() for t in done)
+    finally:
+        for t in pending:
+            t.cancel()
+    return [r for _, r in sorted(results, key=lambda r: r[0])]
+
+
+async def _indexed(i, coro):
+    return i, await coro
+
+
+def mock_async(service_name):
+    """Async counterpart of `sqs.mock_sqs` / `kinesis.mock_kinesis`.
+
+    If AWS is unreachable and MOCK_AWS is set, log the call and return None.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except (
+                botocore.exceptions.NoCredentialsError,
+                botocore.exceptions.ClientError,
+                botocore.exceptions.NoRegionError,
+            ):
+                if config("MOCK_AWS", default=False):
+                    log = kwargs.get("logger") or logging.getLogger()
+                    log.debug(
+                        f"Mocked {service_name}: {func.__name__}() "
+                        f"args={args} kwargs={kwargs}"
+                    )
+                    return
+                else:
+                    raise
+
+        return wrapper
+
+    return decorator
+
+
+@contextlib.asynccontextmanager
+async def _client(service_name, client=None, concurrency=16):
+    """Use the given AsyncClient, or a temporary one that is closed afterwards."""
+    if client:
+        yield client
+    else:
+        async with AsyncClient(service_name, concurrency=concurrency) as client:
+            yield client
+
+
+async def _send_all(client, sender, send_batch, items, concurrency, log_label):
+    responses = await bounded_map(
+        lambda b: client.run(send_batch, b), sender.batches(items), concurrency
+    )
+    sender.stats.end = time.time()
+    sender.logger.info(f"{log_label}: {sender.stats}")
+    return tuple(responses)
+
+
+@mock_async("sqs")
+async def batch_put_messages(
+    queue_url,
+    messages,
+    batch_size=10,
+    message_group_id=None,
+    concurrency=8,
+    client=None,
+    **kwargs,
+):
+    """Async `sqs.batch_put_messages`; batches are sent `concurrency` at a time.
+
+    FIFO sends (`message_group_id`) go one batch at a time to keep ordering.
+    """
+    concurrency = 1 if message_group_id else concurrency
+    async with _client("sqs", client, concurrency) as client:
+        sender = sqs.SQSSender(
+            queue_url,
+            client=client.client,
+            batch_size=batch_size,
+            message_group_id=message_group_id,
+            logger=kwargs.get("logger"),
+        )
+        return await _send_all(
+            client,
+            sender,
+            sender.send_batch,
+            messages,
+            concurrency,
+            f"sqs.send {queue_url}",
+        )
+
+
+@mock_async("kinesis")
+async def batch_put_records(
+    stream_name, records, batch_size=500, concurrency=8, client=None, **kwargs
+):
+    """Async `kinesis.batch_put_records`; batches are put `concurrency` at a time."""
+    async with _client("kinesis", client, concurrency) as client:
+        producer = await client.run(
+            kinesis.KinesisProducer,
+            stream_name,
+            client=client.client,
+            batch_size=batch_size,
+            logger=kwargs.get("logger"),
+        )
+        return await _send_all(
+            client,
+            producer,
+            producer.put_batch,
+            records,
+            concurrency,
+            f"kinesis.send {stream_name}",
+        )
+
+
+@mock_async("sqs")
+async def get_queue_urls(queue_names, concurrency=16):
+    """Resolve many queue names at once, returning {name: url}."""
+    queue_names = list(queue_names)
+    async with _client("sqs", concurrency=concurrency) as client:
+        responses = await bounded_map(
+            lambda name: client.get_queue_url(QueueName=name),
+            queue_names,
+            concurrency,
+        )
+    return {name: r["QueueUrl"] for name, r in zip(queue_names, responses)}
+
+
+async def _run_sync(func, *args):
+    """Await a blocking utils.aws helper on the default executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args))
+
+
+# Fixture setup and teardown already fan out on threads in the sync helpers;
+# these only make them awaitable.
+
+
+async def create_buckets(bucket_names, concurrency=16):
+    bucket_names = list(bucket_names)
+    await _run_sync(s3.create_buckets, bucket_names, concurrency)
+    return bucket_names
+
+
+async def delete_buckets(bucket_names, concurrency=16):
+    await _run_sync(s3.delete_buckets, list(bucket_names), concurrency)
+
+
+async def create_tables(dynamodb_tables, concurrency=16):
+    """Create tables and wait for all of them to exist, returning their names."""
+    return await _run_sync(dynamodb.create_tables, list(dynamodb_tables), concurrency)
+
+
+async def delete_tables(table_names, concurrency=16):
+    await _run_sync(dynamodb.delete_tables, list(table_names), concurrency)
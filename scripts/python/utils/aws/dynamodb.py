@@ -1,3 +1,36 @@
+import logging
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import backoff
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+from utils.aws import (
+    SendStats,
+    backoff_sleep,
+    check_status,
+    get_client,
+    thread_map,
+    wait_all,
+)
+
+MAX_BATCH_WRITE_ITEMS = 25
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def serialize(item):
+    """Convert a plain dict into DynamoDB's typed attribute format."""
+    return {k: _serializer.serialize(v) for k, v in item.items()}
+
+
+def deserialize(item):
+    """Convert a typed DynamoDB item back into a plain dict."""
+    return {k: _deserializer.deserialize(v) for k, v in item.items()}
+
+
 # @pytest.fixture(scope="session")
 # def dynamodb_tables():
 #     return [
@@ -18,27 +51,273 @@
 # @pytest.fixture(scope="class")
 # def dynamodb(localstack, dynamodb_tables):
 #     check(localstack, "dynamodb")
-def create_then_destroy(dynamodb_tables):
-    dbd = boto3.client("dynamodb")
+@backoff.on_exception(backoff.expo, ClientError, max_time=30)
+def create_table(config):
+    config = {**config, "BillingMode": "PAY_PER_REQUEST"}
+    response = get_client("dynamodb").create_table(**config)
+    return check_status(response)
+
 
-    @backoff.on_exception(backoff.expo, ClientError, max_time=30)
-    def create_table(config):
-        config.update({"BillingMode": "PAY_PER_REQUEST"})
-        response = dbd.create_table(**config)
-        return lpipe.utils.check_status(response)
+def wait_for_table(table_name):
+    waiter = get_client("dynamodb").get_waiter("table_exists")
+    waiter.wait(TableName=table_name, WaiterConfig={"Delay": 1, "MaxAttempts": 30})
 
+
+def table_status(table_name):
+    """TableStatus, e.g. "ACTIVE", or None if the table does not exist."""
     try:
-        for table in dynamodb_tables:
-            assert create_table(table)
-
-        for table in dynamodb_tables:
-            waiter = dbd.get_waiter("table_exists")
-            waiter.wait(
-                TableName=table["TableName"],
-                WaiterConfig={"Delay": 1, "MaxAttempts": 30,},
-            )
+        response = get_client("dynamodb").describe_table(TableName=table_name)
+        return response["Table"]["TableStatus"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ResourceNotFoundException":
+            return None
+        raise
+
 
-        yield [t["TableName"] for t in dynamodb_tables]
+def delete_table(table_name):
+    return get_client("dynamodb").delete_table(TableName=table_name)
+
+
+def create_tables(dynamodb_tables, max_workers=8):
+    """Create tables concurrently and wait for all of them in one loop."""
+    for response in thread_map(create_table, dynamodb_tables, max_workers):
+        assert response
+    names = [t["TableName"] for t in dynamodb_tables]
+    wait_all(lambda n: table_status(n) == "ACTIVE", names)
+    return names
+
+
+def delete_tables(table_names, max_workers=8):
+    """Delete tables concurrently and wait for all of them in one loop."""
+    for _ in thread_map(delete_table, table_names, max_workers):
+        pass
+    wait_all(lambda n: table_status(n) is None, table_names)
+
+
+def purge_table(table_name, max_workers=8):
+    """Delete every item in a table, keeping the table itself."""
+    response = get_client("dynamodb").describe_table(TableName=table_name)
+    key_names = [k["AttributeName"] for k in response["Table"]["KeySchema"]]
+    keys = parallel_scan(
+        table_name,
+        plain=False,
+        ProjectionExpression=", ".join(f"#k{i}" for i in range(len(key_names))),
+        ExpressionAttributeNames={f"#k{i}": k for i, k in enumerate(key_names)},
+    )
+    writer = BatchWriter(table_name, max_workers=max_workers, key_names=key_names)
+    return writer.send({"DeleteRequest": {"Key": k}} for k in keys)
+
+
+def create_then_destroy(dynamodb_tables, reuse=False):
+    """Provision tables for a test, yielding their names.
+
+    With `reuse`, tables that already exist are purged instead of recreated
+    and every table is purged rather than deleted afterwards, so a session
+    can share them between tests.
+    """
+    names = [t["TableName"] for t in dynamodb_tables]
+    existing = [n for n in names if reuse and table_status(n) == "ACTIVE"]
+    try:
+        for _ in thread_map(purge_table, existing):
+            pass
+        create_tables([t for t in dynamodb_tables if t["TableName"] not in existing])
+        yield names
     finally:
-        for table in dynamodb_tables:
-            dbd.delete_table(TableName=table["TableName"])
+        if reuse:
+            for _ in thread_map(purge_table, names):
+                pass
+        else:
+            delete_tables(names)
+
+
+class BatchWriter:
+    """Write to a table with several batch_write_item calls in flight.
+
+    Requests are chunked to 25 per call; `UnprocessedItems` are retried with
+    exponential backoff, and whatever remains after `max_attempts` is
+    returned by `send_batch` and counted as failed.
+
+    batch_write_item rejects a call that writes the same key twice, so, like
+    boto3's `overwrite_by_pkeys`, only the last request for each primary key
+    is kept within a chunk. Chunks are written concurrently, so callers must
+    not repeat a key across chunks: which write lands last is undefined. Use
+    `max_workers=1` when a stream may repeat keys far apart.
+
+    Args:
+        table_name (str): Destination table.
+        client: boto3 dynamodb client to reuse.
+        max_workers (int): Number of batch_write_item calls kept in flight.
+        max_attempts (int): Attempts per request, including the first.
+        batch_size (int): Requests per batch_write_item call, at most 25.
+        key_names (list[str], optional): Primary key attribute names; read
+            from the table's KeySchema when not given.
+        logger (optional): Defaults to the root logger.
+
+    """
+
+    def __init__(
+        self,
+        table_name,
+        client=None,
+        max_workers=8,
+        max_attempts=8,
+        batch_size=MAX_BATCH_WRITE_ITEMS,
+        key_names=None,
+        logger=None,
+    ):
+        assert (
+            batch_size <= MAX_BATCH_WRITE_ITEMS
+        )  # batch_write_item will fail otherwise
+        self.table_name = table_name
+        self.client = (
+            client
+            if client
+            else get_client("dynamodb", max_pool_connections=max_workers)
+        )
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.key_names = key_names
+        self.logger = logger if logger else logging.getLogger()
+        self.stats = SendStats()
+
+    def send_batch(self, requests):
+        """Send one batch of write requests, returning any left unprocessed."""
+        sent = len(requests)
+        for attempt in range(self.max_attempts):
+            if attempt:
+                backoff_sleep(attempt)
+                self.stats.update(retried=len(requests))
+            response = self.client.batch_write_item(
+                RequestItems={self.table_name: requests}
+            )
+            requests = response.get("UnprocessedItems", {}).get(self.table_name, [])
+            if not requests:
+                break
+        self.stats.update(batches=1, sent=sent - len(requests), failed=len(requests))
+        return requests
+
+    def _key(self, request):
+        if "PutRequest" in request:
+            attributes = request["PutRequest"]["Item"]
+        else:
+            attributes = request["DeleteRequest"]["Key"]
+        return tuple(tuple(attributes[k].items()) for k in self.key_names)
+
+    def batches(self, requests):
+        """Group requests into chunks of unique primary keys.
+
+        The last request for a key wins within its chunk only.
+        """
+        if self.key_names is None:
+            response = self.client.describe_table(TableName=self.table_name)
+            self.key_names = [
+                k["AttributeName"] for k in response["Table"]["KeySchema"]
+            ]
+        chunk = {}
+        for r in requests:
+            key = self._key(r)
+            chunk.pop(key, None)
+            chunk[key] = r
+            if len(chunk) == self.batch_size:
+                yield list(chunk.values())
+                chunk = {}
+        if chunk:
+            yield list(chunk.values())
+
+    def send(self, requests):
+        """Send an iterable of write requests, returning those that were never processed."""
+        unprocessed = [
+            r
+            for left in thread_map(
+                self.send_batch, self.batches(requests), self.max_workers
+            )
+            for r in left
+        ]
+        self.stats.end = time.time()
+        self.logger.info(f"dynamodb.write {self.table_name}: {self.stats}")
+        return unprocessed
+
+    def put(self, items):
+        """Put plain-dict items."""
+        return self.send({"PutRequest": {"Item": serialize(i)}} for i in items)
+
+    def delete(self, keys):
+        """Delete items by plain-dict primary key."""
+        return self.send({"DeleteRequest": {"Key": serialize(k)}} for k in keys)
+
+
+def batch_put_items(table_name, items, max_workers=8, client=None, **kwargs):
+    """Put plain-dict items into a table, 25 per call with several calls in flight.
+
+    Returns the write requests that were still unprocessed after retries.
+    """
+    writer = BatchWriter(
+        table_name,
+        client=client,
+        max_workers=max_workers,
+        logger=kwargs.get("logger"),
+    )
+    return writer.put(items)
+
+
+def parallel_scan(table_name, total_segments=8, client=None, plain=True, **scan_kwargs):
+    """Yield every item in a table, scanning `total_segments` segments at once.
+
+    Each segment is paginated on its own thread; pages are handed over
+    through a small queue, so items stream out as they arrive rather than
+    after the whole scan. Item order is not defined.
+
+    Args:
+        table_name (str): Table to scan.
+        total_segments (int): Segments, and threads, to scan with.
+        client (optional): boto3 dynamodb client to reuse.
+        plain (bool): Yield plain dicts instead of typed attribute maps.
+        **scan_kwargs: Passed through to scan, e.g. FilterExpression.
+
+    """
+    dynamodb = (
+        client
+        if client
+        else get_client("dynamodb", max_pool_connections=total_segments)
+    )
+    pages = queue.Queue(maxsize=total_segments * 2)
+    done = object()
+    stop = False
+
+    def _scan(segment):
+        try:
+            paginator = dynamodb.get_paginator("scan")
+            for page in paginator.paginate(
+                TableName=table_name,
+                Segment=segment,
+                TotalSegments=total_segments,
+                **scan_kwargs,
+            ):
+                if stop:
+                    break
+                pages.put(page.get("Items", []))
+        except Exception as e:
+            pages.put(e)
+        finally:
+            pages.put(done)
+
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        for segment in range(total_segments):
+            executor.submit(_scan, segment)
+        remaining = total_segments
+        try:
+            while remaining:
+                page = pages.get()
+                if page is done:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from (deserialize(i) for i in page) if plain else page
+        finally:
+            # Let the scanning threads drain out if the caller stops early.
+            stop = True
+            while remaining:
+                if pages.get() is done:
+                    remaining -= 1
@@ -1,21 +1,47 @@
-import json
+import bisect
+import hashlib
 import logging
+import threading
+import time
 from functools import wraps
 
-import boto3
 import botocore
 from decouple import config
-from lpipe.utils import batch, hash
+from utils import batch_by_size, dumps, hash
+from utils.aws import SendStats, backoff_sleep, get_client, thread_map
 
+MAX_BATCH_RECORDS = 500
+MAX_BATCH_BYTES = 5 * 1024 * 1024
+MAX_RECORD_BYTES = 1024 * 1024
+SHARD_BYTES_PER_SECOND = 1024 * 1024
+SHARD_RECORDS_PER_SECOND = 1000
+# Changing the digest changes every PartitionKey, and so shard assignment and
+# per-key ordering; blake2b/xxhash are opt-in through MESSAGE_HASH_ALGORITHM.
+HASH_ALGORITHM = config("MESSAGE_HASH_ALGORITHM", default="sha1")
 
-def build(record_data):
-    data = json.dumps(record_data, sort_keys=True)
-    return {"Data": data, "PartitionKey": hash(data)}
+
+def build(record_data, algorithm=None):
+    """Build a put_records entry; the data is serialized and encoded exactly once."""
+    data = dumps(record_data).encode("ascii")
+    return {"Data": data, "PartitionKey": hash(data, algorithm or HASH_ALGORITHM)}
+
+
+def _record_size(record):
+    """Size of a record as counted against the kinesis payload limits."""
+    size = len(record["Data"]) + len(record["PartitionKey"])
+    if size > MAX_RECORD_BYTES:
+        raise ValueError(f"kinesis record of {size} bytes exceeds {MAX_RECORD_BYTES}")
+    return size
 
 
 def mock_kinesis(func):
     @wraps(func)
     def wrapper(stream_name, records, *args, **kwargs):
+        if config("MOCK_AWS", default=False):
+            # Materialized so the mocked fallback can still log the records
+            # after a generator has been consumed by the real call; real
+            # sends keep streaming.
+            records = list(records or [])
         try:
             return func(stream_name, records, *args, **kwargs)
         except (
@@ -41,17 +67,201 @@ def mock_kinesis(func):
     return wrapper
 
 
-@mock_kinesis
-def batch_put_records(stream_name, records, batch_size=500, **kwargs):
-    """Put records into a kinesis stream, batched by the maximum of 500."""
-    client = boto3.client("kinesis")
-    responses = []
-    for b in batch(records, batch_size):
-        response = client.put_records(
-            StreamName=stream_name, Records=[build(record) for record in b]
+class ShardLimiter:
+    """Per-shard token buckets for the 1 MB/s and 1000 records/s write limits.
+
+    Records are mapped to shards the same way kinesis does it, by the MD5 of
+    their partition key against each open shard's hash key range.
+    """
+
+    def __init__(
+        self,
+        shards,
+        bytes_per_second=SHARD_BYTES_PER_SECOND,
+        records_per_second=SHARD_RECORDS_PER_SECOND,
+    ):
+        shards = sorted(
+            (int(s["HashKeyRange"]["StartingHashKey"]), s["ShardId"]) for s in shards
+        )
+        self._starts = [start for start, _ in shards]
+        self._rates = {"bytes": bytes_per_second, "records": records_per_second}
+        now = time.monotonic()
+        self._buckets = {
+            shard_id: {"bytes": bytes_per_second, "records": records_per_second}
+            for _, shard_id in shards
+        }
+        self._updated = {shard_id: now for _, shard_id in shards}
+        self._shard_ids = [shard_id for _, shard_id in shards]
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    @classmethod
+    def for_stream(cls, client, stream_name, **kwargs):
+        shards = []
+        params = {"StreamName": stream_name}
+        while True:
+            response = client.list_shards(**params)
+            shards.extend(
+                s
+                for s in response["Shards"]
+                if "EndingSequenceNumber" not in s["SequenceNumberRange"]
+            )
+            if not response.get("NextToken"):
+                break
+            params = {"NextToken": response["NextToken"]}
+        return cls(shards, **kwargs)
+
+    def shard_for(self, partition_key):
+        hash_key = int(hashlib.md5(partition_key.encode("utf-8")).hexdigest(), 16)
+        return self._shard_ids[bisect.bisect_right(self._starts, hash_key) - 1]
+
+    def acquire(self, records):
+        """Reserve capacity for `records` and sleep until it is available."""
+        usage = {}
+        for r in records:
+            u = usage.setdefault(self.shard_for(r["PartitionKey"]), [0, 0])
+            u[0] += _record_size(r)
+            u[1] += 1
+        delay = 0.0
+        with self._lock:
+            now = time.monotonic()
+            for shard_id, (n_bytes, n_records) in usage.items():
+                bucket = self._buckets[shard_id]
+                elapsed = now - self._updated[shard_id]
+                self._updated[shard_id] = now
+                for k, n in (("bytes", n_bytes), ("records", n_records)):
+                    rate = self._rates[k]
+                    bucket[k] = min(rate, bucket[k] + elapsed * rate) - n
+                    if bucket[k] < 0:
+                        delay = max(delay, -bucket[k] / rate)
+            self.waited += delay
+        if delay:
+            time.sleep(delay)
+
+
+class KinesisProducer:
+    """Put records into a stream with several put_records calls in flight.
+
+    Records whose result carries an `ErrorCode` (usually throttling) are
+    re-submitted with exponential backoff until `max_attempts` is reached.
+    When `limit_shards` is set, batches wait on a ShardLimiter so each
+    shard stays under its write limits instead of being throttled.
+
+    Args:
+        stream_name (str): Destination stream.
+        client: boto3 kinesis client to reuse.
+        max_workers (int): Number of put_records calls kept in flight.
+        max_attempts (int): Attempts per record, including the first.
+        batch_size (int): Records per put_records call, at most 500.
+        limit_shards (bool): Rate limit per shard using the stream's hash key
+            ranges. Off by default: it lists the stream's shards up front, which
+            costs a round trip and needs kinesis:ListShards.
+        logger (optional): Defaults to the root logger.
+
+    """
+
+    def __init__(
+        self,
+        stream_name,
+        client=None,
+        max_workers=8,
+        max_attempts=5,
+        batch_size=MAX_BATCH_RECORDS,
+        limit_shards=False,
+        logger=None,
+    ):
+        assert batch_size <= MAX_BATCH_RECORDS  # put_records will fail otherwise
+        self.stream_name = stream_name
+        self.client = (
+            client
+            if client
+            else get_client("kinesis", max_pool_connections=max_workers)
+        )
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.logger = logger if logger else logging.getLogger()
+        self.limiter = (
+            ShardLimiter.for_stream(self.client, stream_name) if limit_shards else None
+        )
+        self.stats = SendStats()
+
+    def put_batch(self, records):
+        """Put one batch of built records, re-submitting failed records."""
+        results = [None] * len(records)
+        pending = list(range(len(records)))
+        for attempt in range(self.max_attempts):
+            if attempt:
+                backoff_sleep(attempt)
+                self.stats.update(retried=len(pending))
+            batch_records = [records[i] for i in pending]
+            if self.limiter:
+                self.limiter.acquire(batch_records)
+            response = self.client.put_records(
+                StreamName=self.stream_name, Records=batch_records
+            )
+            failed = []
+            for i, result in zip(pending, response["Records"]):
+                results[i] = result
+                if "ErrorCode" in result:
+                    failed.append(i)
+            pending = failed
+            if not pending:
+                break
+        self.stats.update(
+            batches=1, sent=len(records) - len(pending), failed=len(pending)
+        )
+        response["Records"] = results
+        response["FailedRecordCount"] = len(pending)
+        return response
+
+    def batches(self, records):
+        """Lazily build entries from records and group them into batches."""
+        entries = (build(record) for record in records)
+        return batch_by_size(
+            entries, MAX_BATCH_BYTES, n=self.batch_size, size=_record_size
         )
-        responses.append(response)
-    return tuple(responses)
+
+    def send(self, records):
+        """Send an iterable of records, returning one response per batch in order.
+
+        Each response's `Records` lines up with the batch it was built from and
+        holds the final result for every record; `FailedRecordCount` counts
+        records that still failed after retries.
+        """
+        responses = tuple(
+            thread_map(self.put_batch, self.batches(records), self.max_workers)
+        )
+        self.stats.end = time.time()
+        throttled = f" throttled={self.limiter.waited:.2f}s" if self.limiter else ""
+        self.logger.info(f"kinesis.send {self.stream_name}: {self.stats}{throttled}")
+        return responses
+
+
+@mock_kinesis
+def batch_put_records(
+    stream_name,
+    records,
+    batch_size=500,
+    max_workers=8,
+    client=None,
+    limit_shards=False,
+    **kwargs,
+):
+    """Put records into a kinesis stream, batched by the maximum of 500 records / 5 MB.
+
+    `records` may be any iterable; batches are sent concurrently by a
+    KinesisProducer as they are consumed, and failed records are retried.
+    """
+    producer = KinesisProducer(
+        stream_name,
+        client=client,
+        max_workers=max_workers,
+        batch_size=batch_size,
+        limit_shards=limit_shards,
+        logger=kwargs.get("logger"),
+    )
+    return producer.send(records)
 
 
 def put_record(stream_name, data, **kwargs):
@@ -1,25 +1,441 @@
+import hashlib
+import heapq
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import backoff
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError, ConnectionClosedError
+from utils.aws import SendStats, check_status, get_client, thread_map, wait_all
+
+MAX_DELETE_KEYS = 1000
+MB = 1024 * 1024
+_DONE = object()  # a worker's end-of-prefix marker in list_objects_parallel
+
+
 @backoff.on_exception(backoff.expo, (ClientError, ConnectionClosedError), max_time=30)
-def create_bucket(b):
+def create_bucket(b, wait=True):
+    s3 = get_client("s3")
     response = s3.create_bucket(Bucket=b)
     check_status(response)
-    s3.get_waiter("bucket_exists").wait(Bucket=b)
+    if wait:
+        s3.get_waiter("bucket_exists").wait(Bucket=b)
+
+
+def bucket_exists(b):
+    """True if the bucket exists; errors other than "not found" are raised."""
+    try:
+        get_client("s3").head_bucket(Bucket=b)
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchBucket"):
+            return False
+        raise
+
+
+def _page_markers(b, versions=True):
+    """Yield the listing arguments that start each page of a bucket listing.
+
+    Only the position of each page is kept, not its keys. Positions do not
+    move when keys on other pages are deleted, so the pages can be listed
+    again and deleted in any order.
+    """
+    s3 = get_client("s3")
+    if versions:
+        markers = {}
+        while True:
+            yield markers
+            page = s3.list_object_versions(Bucket=b, MaxKeys=MAX_DELETE_KEYS, **markers)
+            if not page.get("IsTruncated"):
+                return
+            markers = {
+                "KeyMarker": page["NextKeyMarker"],
+                "VersionIdMarker": page["NextVersionIdMarker"],
+            }
+    else:
+        markers = {}
+        while True:
+            yield markers
+            page = s3.list_objects_v2(Bucket=b, MaxKeys=MAX_DELETE_KEYS, **markers)
+            if not page.get("IsTruncated"):
+                return
+            markers = {"StartAfter": page["Contents"][-1]["Key"]}
+
+
+def _page_objects(s3, b, markers, versions=True):
+    """The {"Key"[, "VersionId"]} entries of the page starting at `markers`."""
+    if versions:
+        page = s3.list_object_versions(Bucket=b, MaxKeys=MAX_DELETE_KEYS, **markers)
+        return [
+            {"Key": v["Key"], "VersionId": v["VersionId"]}
+            for v in page.get("Versions", []) + page.get("DeleteMarkers", [])
+        ]
+    page = s3.list_objects_v2(Bucket=b, MaxKeys=MAX_DELETE_KEYS, **markers)
+    return [{"Key": o["Key"]} for o in page.get("Contents", [])]
+
+
+def empty_bucket(b, versions=True, max_workers=8, logger=None):
+    """Delete every object in a bucket with concurrent 1000-key delete_objects calls.
+
+    The bucket is listed once to find where each 1000-key page starts; each
+    worker then lists one page and deletes it. Nothing is deleted while a
+    listing is being paginated, and only page positions are held in memory.
+    With `versions` set, all object versions and delete markers are removed
+    as well, which a versioned bucket needs before it can be deleted.
+
+    Returns:
+        list[dict]: The `Errors` entries from every batch; empty on success.
+
+    """
+    log = logger if logger else logging.getLogger()
+    s3 = get_client("s3", max_pool_connections=max_workers)
+
+    def _delete(markers):
+        objects = _page_objects(s3, b, markers, versions)
+        if not objects:
+            return 0, []
+        response = s3.delete_objects(
+            Bucket=b, Delete={"Objects": objects, "Quiet": True}
+        )
+        errors = response.get("Errors", [])
+        if errors:
+            log.warning(
+                f"s3.delete_objects {b}: {len(errors)} of {len(objects)} failed"
+            )
+        return len(objects), errors
+
+    deleted = 0
+    errors = []
+    markers = list(_page_markers(b, versions))
+    for n, batch_errors in thread_map(_delete, markers, max_workers):
+        deleted += n - len(batch_errors)
+        errors.extend(batch_errors)
+    log.info(f"s3.empty_bucket {b}: deleted={deleted} errors={len(errors)}")
+    return errors
 
 
 @backoff.on_exception(backoff.expo, (ClientError, ConnectionClosedError), max_time=30)
-def delete_bucket(b):
-    bucket = boto3.resource("s3").Bucket(b)
-    objects = bucket.objects.all()
-    keys = [s3.delete_object(Bucket=b, Key=o.key) for o in objects]
+def delete_bucket(b, versions=True, max_workers=8, wait=True):
+    s3 = get_client("s3")
+    errors = empty_bucket(b, versions=versions, max_workers=max_workers)
+    if errors:
+        raise Exception(f"failed to empty bucket {b}: {errors[:10]}")
     response = s3.delete_bucket(Bucket=b)
     check_status(response)
-    s3.get_waiter("bucket_not_exists").wait(Bucket=b)
+    if wait:
+        s3.get_waiter("bucket_not_exists").wait(Bucket=b)
+
+
+class TransferStats(SendStats):
+    """SendStats plus bytes transferred and files skipped as already present."""
+
+    def __init__(self):
+        super().__init__()
+        self.bytes = 0
+        self.skipped = 0
+
+    def __repr__(self):
+        mb_per_second = self.bytes / MB / self.elapsed if self.elapsed else 0.0
+        return (
+            f"TransferStats<files={self.sent} skipped={self.skipped} "
+            f"failed={self.failed} bytes={self.bytes} elapsed={self.elapsed:.2f}s "
+            f"throughput={mb_per_second:.1f}MB/s>"
+        )
+
+
+def list_objects(b, prefix="", client=None):
+    """Yield object summaries (Key, Size, ETag, LastModified...) page by page."""
+    s3 = client if client else get_client("s3")
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=b, Prefix=prefix):
+        yield from page.get("Contents", [])
+
+
+def list_prefixes(b, prefix="", delimiter="/", client=None):
+    """Yield the common prefixes one level below `prefix`."""
+    s3 = client if client else get_client("s3")
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=b, Prefix=prefix, Delimiter=delimiter):
+        for p in page.get("CommonPrefixes", []):
+            yield p["Prefix"]
+
+
+def list_objects_parallel(
+    b, prefix="", delimiter="/", prefixes=None, max_workers=8, client=None
+):
+    """Yield every object under `prefix`, listing sub-prefixes concurrently.
+
+    A single delimiter listing of `prefix` yields the objects directly under
+    it and hands each common prefix (or each of the given `prefixes`) to a
+    worker as soon as it is seen. Workers paginate their prefix and pass pages
+    through a bounded queue, so at most about 2 * `max_workers` pages are
+    held in memory. Objects are yielded in no particular order.
+    """
+    s3 = client if client else get_client("s3", max_pool_connections=max_workers)
+    paginator = s3.get_paginator("list_objects_v2")
+    pages = queue.Queue(maxsize=2 * max_workers)
+    stop = threading.Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _list(p):
+        if stop.is_set():
+            return
+        try:
+            for page in paginator.paginate(Bucket=b, Prefix=p):
+                if not _put(page.get("Contents", [])):
+                    return
+            _put(_DONE)
+        except Exception as e:
+            _put(e)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = 0
+    try:
+        if prefixes is None:
+            for page in paginator.paginate(
+                Bucket=b, Prefix=prefix, Delimiter=delimiter
+            ):
+                for p in page.get("CommonPrefixes", []):
+                    executor.submit(_list, p["Prefix"])
+                    pending += 1
+                yield from page.get("Contents", [])
+        else:
+            for p in prefixes:
+                executor.submit(_list, p)
+                pending += 1
+        while pending:
+            item = pages.get()
+            if item is _DONE:
+                pending -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield from item
+    finally:
+        # Unblock workers if the caller stopped early or a listing failed.
+        stop.set()
+        executor.shutdown(wait=True)
+
+
+def newest(objects, k=10):
+    """The `k` most recently modified objects, newest first, using a k-sized heap."""
+    return heapq.nlargest(k, objects, key=lambda o: o["LastModified"])
+
+
+class ObjectIndex:
+    """SQLite snapshot of a bucket listing, for repeated local queries.
+
+    Args:
+        path (str): Database file; ":memory:" keeps it in process.
+
+    """
+
+    def __init__(self, path=":memory:"):
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            "bucket TEXT, key TEXT, size INTEGER, etag TEXT, last_modified TEXT, "
+            "PRIMARY KEY (bucket, key))"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS objects_last_modified "
+            "ON objects (bucket, last_modified)"
+        )
+
+    def load(self, b, objects):
+        """Replace the snapshot of bucket `b` with `objects`; returns the row count."""
+        with self.db:
+            self.db.execute("DELETE FROM objects WHERE bucket = ?", (b,))
+            cursor = self.db.executemany(
+                "INSERT INTO objects VALUES (?, ?, ?, ?, ?)",
+                (
+                    (b, o["Key"], o["Size"], o["ETag"], o["LastModified"].isoformat())
+                    for o in objects
+                ),
+            )
+        return cursor.rowcount
+
+    def query(self, b, prefix="", newest=None):
+        """Yield object summaries under `prefix`, optionally the `newest` few."""
+        sql = (
+            "SELECT key, size, etag, last_modified FROM objects "
+            "WHERE bucket = ? AND key >= ? AND key < ?"
+        )
+        if newest:
+            sql += f" ORDER BY last_modified DESC LIMIT {int(newest)}"
+        else:
+            sql += " ORDER BY key"
+        for key, size, etag, last_modified in self.db.execute(
+            sql, (b, prefix, prefix + "\U0010ffff")
+        ):
+            yield {
+                "Key": key,
+                "Size": size,
+                "ETag": etag,
+                "LastModified": datetime.fromisoformat(last_modified),
+            }
+
+    def close(self):
+        self.db.close()
+
+
+def _etag_matches(path, etag):
+    etag = etag.strip('"')
+    if "-" in etag:
+        # Multipart ETags are not a plain MD5 of the content; trust the size.
+        return True
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(MB), b""):
+            md5.update(chunk)
+    return md5.hexdigest() == etag
+
+
+def _is_current(path, obj, check_etag):
+    try:
+        if path.stat().st_size != obj["Size"]:
+            return False
+    except FileNotFoundError:
+        return False
+    return not check_etag or _etag_matches(path, obj["ETag"])
+
+
+def download_objects(
+    b,
+    dest,
+    prefix="",
+    key_filter=None,
+    path_for=None,
+    client=None,
+    max_workers=8,
+    part_size=8 * MB,
+    part_concurrency=4,
+    check_etag=False,
+    logger=None,
+):
+    """Download every object under a prefix, several objects at a time.
+
+    Objects stream from the paginator straight to disk. Objects above
+    `part_size` are fetched as concurrent ranged GETs. Files that already
+    exist with the same size (and MD5 ETag when `check_etag` is set) are
+    skipped.
+
+    Args:
+        b (str): Bucket name.
+        dest (str|Path): Local directory.
+        prefix (str): Key prefix to list.
+        key_filter (callable, optional): Only download keys for which it is true.
+        path_for (callable, optional): Maps a key to its local Path; defaults
+            to the key's path under `dest`.
+        client (optional): boto3 s3 client; defaults to the cached one. Give
+            it max_pool_connections of at least max_workers * part_concurrency.
+        max_workers (int): Objects downloaded concurrently.
+        part_size (int): Multipart threshold and ranged GET size in bytes.
+        part_concurrency (int): Ranged GETs in flight per object.
+        check_etag (bool): Compare MD5 of present files against the ETag.
+
+    Returns:
+        TransferStats
+
+    """
+    log = logger if logger else logging.getLogger()
+    dest = Path(dest)
+    path_for = path_for if path_for else lambda key: dest / key
+    s3 = (
+        client
+        if client
+        else get_client("s3", max_pool_connections=max_workers * part_concurrency)
+    )
+    transfer_config = TransferConfig(
+        multipart_threshold=part_size,
+        multipart_chunksize=part_size,
+        max_concurrency=part_concurrency,
+    )
+    stats = TransferStats()
+
+    def _download(obj):
+        path = Path(path_for(obj["Key"]))
+        if _is_current(path, obj, check_etag):
+            stats.update(skipped=1)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            # download_file writes to a temporary name and renames when done.
+            s3.download_file(b, obj["Key"], str(path), Config=transfer_config)
+            stats.update(sent=1, bytes=obj["Size"])
+        except ClientError as e:
+            log.warning(f"s3.download {b}/{obj['Key']}: {e}")
+            stats.update(failed=1)
+
+    objects = (
+        o
+        for o in list_objects(b, prefix, client=s3)
+        # Keys ending in "/" are folder placeholders, not files.
+        if not o["Key"].endswith("/") and (not key_filter or key_filter(o["Key"]))
+    )
+    for _ in thread_map(_download, objects, max_workers):
+        pass
+    stats.end = time.time()
+    log.info(f"s3.download_objects {b}/{prefix}: {stats}")
+    return stats
+
+
+def create_buckets(bucket_names, max_workers=8):
+    """Create buckets concurrently and wait for all of them in one loop."""
+    for _ in thread_map(
+        lambda b: create_bucket(b, wait=False), bucket_names, max_workers
+    ):
+        pass
+    wait_all(bucket_exists, bucket_names)
+
+
+def delete_buckets(bucket_names, max_workers=8):
+    """Empty and delete buckets concurrently, waiting for all of them in one loop."""
+    for _ in thread_map(
+        lambda b: delete_bucket(b, wait=False), bucket_names, max_workers
+    ):
+        pass
+    wait_all(lambda b: not bucket_exists(b), bucket_names)
+
+
+def empty_buckets(bucket_names, max_workers=8):
+    bucket_names = list(bucket_names)
+    for b, errors in zip(
+        bucket_names, thread_map(empty_bucket, bucket_names, max_workers)
+    ):
+        if errors:
+            raise Exception(f"failed to empty bucket {b}: {errors[:10]}")
+
 
+def create_then_destroy(bucket_name, reuse=False):
+    """Provision one bucket name, or a list of them, for a test.
 
-def create_then_destroy(bucket_name):
+    With `reuse`, buckets that already exist are emptied instead of
+    recreated and every bucket is emptied rather than deleted afterwards,
+    so a session can share them between tests.
+    """
     # check(localstack, "s3")
-    s3 = boto3.client("s3")
+    bucket_names = [bucket_name] if isinstance(bucket_name, str) else list(bucket_name)
+    existing = [b for b in bucket_names if reuse and bucket_exists(b)]
     try:
-        create_bucket(bucket_name)
+        empty_buckets(existing)
+        create_buckets([b for b in bucket_names if b not in existing])
         yield bucket_name
     finally:
-        delete_bucket(bucket_name)
+        if reuse:
+            empty_buckets(bucket_names)
+        else:
+            delete_buckets(bucket_names)
@@ -3,12 +3,20 @@
 Each check takes a :class:`.LocalstackSession` and
 raises :class:`~pytest_localstack.exceptions.ServiceError`
 if the service is not available.
+
+:func:`probe` runs many checks concurrently, remembering healthy
+services for a few seconds.
 """
+
 from __future__ import absolute_import
 
+import collections
 import contextlib
 import functools
 import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import botocore.config
 import six
@@ -42,6 +50,36 @@ def port_check(service_name):
     return _check
 
 
+_check_clients = {}
+_check_clients_lock = threading.Lock()
+
+
+def _check_client(localstack_session, service_name):
+    """Build a check client once per botocore session and service.
+
+    Clients are built outside the lock, so cold probes build theirs in
+    parallel; the first one stored wins.
+    """
+    key = (localstack_session.botocore, service_name)
+    client = _check_clients.get(key)
+    if client is not None:
+        return client
+    config_kwargs = {
+        "connect_timeout": 1,
+        "read_timeout": 1,
+        "s3": {"addressing_style": "path"},
+    }
+    if constants.BOTOCORE_VERSION >= (1, 6, 0):
+        config_kwargs["retries"] = {"max_attempts": 1}
+    client = localstack_session.botocore.client(
+        service_name,
+        # Handle retries at a higher level
+        config=botocore.config.Config(**config_kwargs),
+    )
+    with _check_clients_lock:
+        return _check_clients.setdefault(key, client)
+
+
 def botocore_check(service_name, client_func_name):
     """Decorator to check service via botocore Client.
 
@@ -56,18 +94,7 @@ def botocore_check(service_name, client_func_name):
             url = localstack_session.endpoint_url(service_name)
             if not is_port_open(url):
                 raise exceptions.ServiceError(service_name=service_name)
-            config_kwargs = {
-                "connect_timeout": 1,
-                "read_timeout": 1,
-                "s3": {"addressing_style": "path"},
-            }
-            if constants.BOTOCORE_VERSION >= (1, 6, 0):
-                config_kwargs["retries"] = {"max_attempts": 1}
-            client = localstack_session.botocore.client(
-                service_name,
-                # Handle retries at a higher level
-                config=botocore.config.Config(**config_kwargs),
-            )
+            client = _check_client(localstack_session, service_name)
             client_func = getattr(client, client_func_name)
             try:
                 response = client_func()
@@ -157,3 +184,48 @@ SERVICE_CHECKS = {
 
 # All services should have a check.
 assert set(SERVICE_CHECKS) == set(constants.SERVICE_PORTS)
+
+HEALTHY_TTL = 5  # seconds a passing check is trusted for
+
+ProbeResult = collections.namedtuple(
+    "ProbeResult", ["service_name", "ok", "latency", "cached", "error"]
+)
+
+_healthy = {}
+
+
+def _probe_one(localstack_session, service_name, ttl):
+    url = localstack_session.endpoint_url(service_name)
+    start = time.time()
+    if start - _healthy.get((url, service_name), 0) < ttl:
+        return ProbeResult(service_name, True, 0.0, True, None)
+    try:
+        SERVICE_CHECKS[service_name](localstack_session)
+    except exceptions.ServiceError as e:
+        _healthy.pop((url, service_name), None)
+        return ProbeResult(service_name, False, time.time() - start, False, e)
+    _healthy[(url, service_name)] = time.time()
+    return ProbeResult(service_name, True, time.time() - start, False, None)
+
+
+def probe(localstack_session, service_names=None, ttl=HEALTHY_TTL, max_workers=16):
+    """Check services concurrently, returning {service_name: ProbeResult}.
+
+    Services that passed within the last `ttl` seconds are not checked again.
+    `latency` is the time the check took, in seconds.
+    """
+    service_names = list(service_names or SERVICE_CHECKS)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            lambda s: _probe_one(localstack_session, s, ttl), service_names
+        )
+        return {r.service_name: r for r in results}
+
+
+def check_all(localstack_session, service_names=None, ttl=HEALTHY_TTL):
+    """Probe services and raise the first ServiceError, if any."""
+    results = probe(localstack_session, service_names, ttl=ttl)
+    for result in results.values():
+        if not result.ok:
+            raise result.error
+    return results
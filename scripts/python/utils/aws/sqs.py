@@ -1,21 +1,51 @@
-import json
 import logging
+import re
+import time
+from collections import namedtuple
 from functools import wraps
 
-import boto3
+import backoff
 import botocore
+from botocore.exceptions import ClientError
 from decouple import config
-from utils import batch, hash
+from utils import batch_by_size, dumps, hash
+from utils.aws import (
+    SendStats,
+    _session_key,
+    backoff_sleep,
+    check_status,
+    get_client,
+    thread_map,
+    wait_all,
+)
+from utils.cache import Cache
 
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 256 * 1024
+# Entry Ids stay sha1 unless MESSAGE_HASH_ALGORITHM opts in to another digest.
+HASH_ALGORITHM = config("MESSAGE_HASH_ALGORITHM", default="sha1")
 
-def build(message_data, message_group_id=None):
-    data = json.dumps(message_data, sort_keys=True)
-    msg = {"Id": hash(data), "MessageBody": data}
+
+def build(message_data, message_group_id=None, algorithm=None):
+    """Build a send_message_batch entry; the body is serialized exactly once.
+
+    dumps escapes non-ASCII characters, so the body's ASCII bytes are
+    hashed directly for the entry Id and its length is its size in bytes.
+    """
+    data = dumps(message_data)
+    msg = {
+        "Id": hash(data.encode("ascii"), algorithm or HASH_ALGORITHM),
+        "MessageBody": data,
+    }
     if message_group_id:
         msg["MessageGroupId"] = str(message_group_id)
     return msg
 
 
+def _entry_size(entry):
+    return len(entry["MessageBody"])
+
+
 def mock_sqs(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -40,21 +70,120 @@ def mock_sqs(func):
     return wrapper
 
 
+class SQSSender:
+    """Send messages to a queue with several send_message_batch calls in flight.
+
+    One client is shared by all worker threads. Entries reported in `Failed`
+    that are not sender faults are retried with exponential backoff; sender
+    faults are permanent and returned as-is.
+
+    Args:
+        queue_url (str): Destination queue.
+        client: boto3 sqs client to reuse.
+        max_workers (int): Number of send_message_batch calls kept in flight.
+            Forced to 1 for FIFO sends (`message_group_id`) to preserve ordering.
+        max_attempts (int): Attempts per entry, including the first.
+        batch_size (int): Entries per send_message_batch call, at most 10.
+        message_group_id (str, optional): MessageGroupId for FIFO queues.
+        logger (optional): Defaults to the root logger.
+
+    """
+
+    def __init__(
+        self,
+        queue_url,
+        client=None,
+        max_workers=8,
+        max_attempts=5,
+        batch_size=MAX_BATCH_ENTRIES,
+        message_group_id=None,
+        logger=None,
+    ):
+        assert batch_size <= MAX_BATCH_ENTRIES  # send_message_batch will fail otherwise
+        self.queue_url = queue_url
+        self.client = (
+            client if client else get_client("sqs", max_pool_connections=max_workers)
+        )
+        self.max_workers = 1 if message_group_id else max_workers
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.message_group_id = message_group_id
+        self.logger = logger if logger else logging.getLogger()
+        self.stats = SendStats()
+
+    def send_batch(self, entries):
+        """Send one batch of built entries, retrying failed entries."""
+        successful = []
+        permanent = []  # sender faults from every attempt
+        for attempt in range(self.max_attempts):
+            if attempt:
+                backoff_sleep(attempt)
+                self.stats.update(retried=len(entries))
+            response = self.client.send_message_batch(
+                QueueUrl=self.queue_url, Entries=entries
+            )
+            successful.extend(response.get("Successful", []))
+            permanent.extend(
+                f for f in response.get("Failed", []) if f.get("SenderFault")
+            )
+            retryable = [
+                f for f in response.get("Failed", []) if not f.get("SenderFault")
+            ]
+            if not retryable:
+                break
+            retry_ids = {f["Id"] for f in retryable}
+            entries = [e for e in entries if e["Id"] in retry_ids]
+        failed = permanent + retryable
+        self.stats.update(batches=1, sent=len(successful), failed=len(failed))
+        response["Successful"] = successful
+        response["Failed"] = failed
+        return response
+
+    def batches(self, messages):
+        """Lazily build entries from messages and group them into batches."""
+        entries = (build(m, self.message_group_id) for m in messages)
+        return batch_by_size(
+            entries, MAX_BATCH_BYTES, n=self.batch_size, size=_entry_size
+        )
+
+    def send(self, messages):
+        """Send an iterable of messages, returning one response per batch in order.
+
+        Each response aggregates every attempt for its batch: `Successful`
+        holds all delivered entries and `Failed` whatever was left after retries.
+        """
+        responses = tuple(
+            thread_map(self.send_batch, self.batches(messages), self.max_workers)
+        )
+        self.stats.end = time.time()
+        self.logger.info(f"sqs.send {self.queue_url}: {self.stats}")
+        return responses
+
+
 @mock_sqs
 def batch_put_messages(
-    queue_url, messages, batch_size=10, message_group_id=None, **kwargs
+    queue_url,
+    messages,
+    batch_size=10,
+    message_group_id=None,
+    max_workers=8,
+    client=None,
+    **kwargs,
 ):
-    """Put messages into a sqs queue, batched by the maximum of 10."""
-    assert batch_size <= 10  # send_message_batch will fail otherwise
-    client = boto3.client("sqs")
-    responses = []
-    for b in batch(messages, batch_size):
-        response = client.send_message_batch(
-            QueueUrl=queue_url,
-            Entries=[build(message, message_group_id) for message in b],
-        )
-        responses.append(response)
-    return tuple(responses)
+    """Put messages into a sqs queue, batched by the maximum of 10 entries / 256 KB.
+
+    `messages` may be any iterable; batches are sent concurrently by an SQSSender
+    as they are consumed, and failed entries are retried.
+    """
+    sender = SQSSender(
+        queue_url,
+        client=client,
+        max_workers=max_workers,
+        batch_size=batch_size,
+        message_group_id=message_group_id,
+        logger=kwargs.get("logger"),
+    )
+    return sender.send(messages)
 
 
 def put_message(queue_url, data, message_group_id=None, **kwargs):
@@ -63,61 +192,236 @@ def put_message(queue_url, data, message_group_id=None, **kwargs):
     )
 
 
+QUEUE_URL_TTL = 300
+QUEUE_URL_NEGATIVE_TTL = 10
+PURGE_TIMEOUT = 60
+
+QueuePair = namedtuple("QueuePair", ["name", "url", "dlq_url"])
+
+_queue_urls = Cache(ttl=QUEUE_URL_TTL, negative_ttl=QUEUE_URL_NEGATIVE_TTL)
+_queue_listings = Cache(ttl=QUEUE_URL_TTL)
+
+
+def name_from_url(queue_url):
+    return queue_url.rstrip("/").split("/")[-1]
+
+
+def _cache_key(client, name):
+    # Queue URLs hold the account id, so entries are per profile and
+    # credentials file too, not only per region and endpoint.
+    return (
+        (client.meta.region_name, client.meta.endpoint_url) + _session_key() + (name,)
+    )
+
+
 @mock_sqs
-def get_queue_url(queue_name):
-    client = boto3.client("sqs")
-    response = client.get_queue_url(QueueName=queue_name)
-    return response["QueueUrl"]
+def get_queue_url(queue_name, refresh=False, region_name=None):
+    """Resolve a queue name to its URL.
+
+    URLs are cached per account, region and endpoint for QUEUE_URL_TTL
+    seconds. A missing queue is remembered for QUEUE_URL_NEGATIVE_TTL seconds
+    and raises QueueDoesNotExist without another call; `create_queue` forgets
+    it straight away.
+    """
+    client = get_client("sqs", region_name=region_name)
+    key = _cache_key(client, queue_name)
+    if refresh:
+        _queue_urls.pop(key)
+
+    def _fetch(key):
+        try:
+            return client.get_queue_url(QueueName=queue_name)["QueueUrl"]
+        except client.exceptions.QueueDoesNotExist:
+            return None
 
+    url = _queue_urls.get(key, _fetch)
+    if not url:
+        raise client.exceptions.QueueDoesNotExist(
+            {
+                "Error": {
+                    "Code": "AWS.SimpleQueueService.NonExistentQueue",
+                    "Message": f"The specified queue {queue_name} does not exist.",
+                }
+            },
+            "GetQueueUrl",
+        )
+    return url
+
+
+def forget_queue_url(queue_name):
+    """Drop cached lookups for a queue, e.g. after creating or deleting it."""
+    for key in [k for k in _queue_urls.keys() if k[-1] == queue_name]:
+        _queue_urls.pop(key)
+    _queue_listings.clear()
 
-def queue_exists(q):
+
+def queue_exists(q, refresh=False):
     try:
-        get_queue_url(q)
+        get_queue_url(q, refresh=refresh)
         return True
     except:
         return False
 
 
+def list_queue_urls(prefix, refresh=False, region_name=None):
+    """List queue URLs by name prefix, cached for QUEUE_URL_TTL seconds.
+
+    The listed URLs also warm the `get_queue_url` cache.
+    """
+    client = get_client("sqs", region_name=region_name)
+    key = _cache_key(client, prefix)
+    urls = None if refresh else _queue_listings.lookup(key)
+    if urls is None:
+        urls = []
+        for page in client.get_paginator("list_queues").paginate(
+            QueueNamePrefix=prefix
+        ):
+            urls.extend(page.get("QueueUrls", []))
+        for url in urls:
+            _queue_urls.set(_cache_key(client, name_from_url(url)), url)
+        _queue_listings.set(key, tuple(urls))
+    return list(urls)
+
+
+def list_queue_pairs(prefix, refresh=False, region_name=None):
+    """List queues by name prefix, paired with their dead letter queues.
+
+    A queue's DLQ is the queue whose name matches once "dlq" is removed,
+    e.g. "lam-shepherd" and "lam-shepherd-dlq".
+
+    Returns:
+        list[QueuePair]: One pair per non-DLQ queue; `dlq_url` may be None.
+
+    """
+
+    def _base(name):
+        return re.sub(r"[-_.]?dlq", "", name)
+
+    queues, dlqs = {}, {}
+    for url in list_queue_urls(prefix, refresh=refresh, region_name=region_name):
+        name = name_from_url(url)
+        if "dlq" in name:
+            dlqs[_base(name)] = url
+        else:
+            queues[name] = url
+    return [QueuePair(name, url, dlqs.get(_base(name))) for name, url in queues.items()]
+
+
 def wait_for_queues_exist(queue_names):
-    for queue_name in queue_names:
-        while not queue_exists(queue_name):
-            sleep(1)
+    wait_all(lambda q: queue_exists(q, refresh=True), queue_names)
 
 
 @backoff.on_exception(backoff.expo, ClientError, max_time=30)
-def create_queue(q):
-    response = client.create_queue(QueueName=queue_name)
+def create_queue(queue_name):
+    response = get_client("sqs").create_queue(QueueName=queue_name)
     check_status(response)
+    forget_queue_url(queue_name)
     return response["QueueUrl"]
 
 
-def create_queues(queue_names):
-    queues = {}
-    for queue_name in queue_names:
-        try:
-            queues[queue_name] = create_queue(queue_name)
-        except ClientError as e:
-            exists = queue_exists(queue_name)
-            raise Exception(f"queue_exists({queue_name}) -> {exists}") from e
-    return queues
+def _create_queue(queue_name):
+    try:
+        return create_queue(queue_name)
+    except ClientError as e:
+        exists = queue_exists(queue_name)
+        raise Exception(f"queue_exists({queue_name}) -> {exists}") from e
+
+
+def create_queues(queue_names, max_workers=8):
+    """Create queues concurrently, returning {name: url}."""
+    urls = thread_map(_create_queue, queue_names, max_workers)
+    return dict(zip(queue_names, urls))
+
+
+def _drain_queue(queue_url):
+    sqs = get_client("sqs")
+    while True:
+        response = sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10)
+        messages = response.get("Messages", [])
+        if not messages:
+            return
+        sqs.delete_message_batch(
+            QueueUrl=queue_url,
+            Entries=[
+                {"Id": str(i), "ReceiptHandle": m["ReceiptHandle"]}
+                for i, m in enumerate(messages)
+            ],
+        )
+
+
+def _queue_depth(queue_url):
+    attributes = get_client("sqs").get_queue_attributes(
+        QueueUrl=queue_url,
+        AttributeNames=[
+            "ApproximateNumberOfMessages",
+            "ApproximateNumberOfMessagesNotVisible",
+            "ApproximateNumberOfMessagesDelayed",
+        ],
+    )["Attributes"]
+    return sum(int(v) for v in attributes.values())
+
+
+def purge_queue(queue_name, timeout=PURGE_TIMEOUT):
+    """Delete every message in a queue and wait until it reports empty.
+
+    PurgeQueue is allowed once a minute per queue, so when it is refused the
+    queue is drained with receive/delete instead. A purge can take up to 60
+    seconds to finish, so the queue is drained and polled until its message
+    counts reach zero, raising if that takes longer than `timeout` seconds.
+    """
+    url = get_queue_url(queue_name)
+    try:
+        get_client("sqs").purge_queue(QueueUrl=url)
+    except ClientError as e:
+        if "PurgeQueueInProgress" not in e.response["Error"]["Code"]:
+            raise
+    deadline = time.time() + timeout
+    while _queue_depth(url):
+        if time.time() > deadline:
+            raise Exception(f"queue {queue_name} not empty after {timeout}s")
+        _drain_queue(url)
+        time.sleep(1)
+
+
+def purge_queues(queue_names, max_workers=8):
+    """Purge queues concurrently."""
+    for _ in thread_map(purge_queue, queue_names, max_workers):
+        pass
 
 
 def delete_queue(q):
     delete_queues([q])
 
 
-def delete_queues(queue_names):
-    for queue_name in queue_names:
-        url = get_queue_url(queue_name)
-        client.delete_queue(QueueUrl=url)
+def delete_queues(queue_names, max_workers=8):
+    sqs = get_client("sqs", max_pool_connections=max_workers)
+
+    def _delete(queue_name):
+        sqs.delete_queue(QueueUrl=get_queue_url(queue_name))
+        forget_queue_url(queue_name)
+
+    for _ in thread_map(_delete, queue_names, max_workers):
+        pass
+
 
+def create_then_destroy(queue_names, reuse=False):
+    """Provision queues for a test, yielding {name: url}.
 
-def create_then_destroy(queue_names):
+    With `reuse`, queues that already exist are purged instead of recreated
+    and every queue is purged rather than deleted afterwards, so a session
+    can share them between tests. Reused queues are empty when yielded.
+    """
     # check(localstack, "sqs")
-    client = boto3.client("sqs")
+    queue_names = list(queue_names)
+    existing = [q for q in queue_names if reuse and queue_exists(q, refresh=True)]
     try:
-        queues = create_queues(queue_names)
+        purge_queues(existing)
+        queues = create_queues([q for q in queue_names if q not in existing])
         wait_for_queues_exist(queue_names)
+        queues.update((q, get_queue_url(q)) for q in existing)
         yield queues
     finally:
-        delete_queues(queue_names)
+        if reuse:
+            purge_queues(queue_names)
+        else:
+            delete_queues(queue_names)
@@ -0,0 +1,305 @@
+import collections
+import json
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+_MISSING = object()
+_ABSENT = object()  # negative entry for a key a get_dict fetcher did not return
+
+
+class Cache:
+    """Thread-safe LRU cache with expiry, negative caching and hit/miss counters.
+
+    Concurrent `get`/`get_dict` calls for a key that is already being fetched
+    wait for that fetch instead of starting another.
+
+    Args:
+        maxsize (int, optional): Evict least recently used entries beyond this.
+        ttl (float, optional): Seconds an entry lives after it is stored.
+        idle_ttl (float, optional): Seconds an entry lives after it was last used.
+        negative_ttl (float, optional): Seconds to remember a falsy `get` result,
+            or a key a `get_dict` fetcher did not return. Not cached if None.
+
+    """
+
+    def __init__(self, maxsize=None, ttl=None, idle_ttl=None, negative_ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.idle_ttl = idle_ttl
+        self.negative_ttl = negative_ttl
+        self._entries = collections.OrderedDict()  # key -> [expires, used, value]
+        self._lock = threading.RLock()
+        self._inflight = {}  # key -> Future of the fetch in progress
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def stats(self):
+        return {
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def __repr__(self):
+        return "Cache<{}>".format(" ".join(f"{k}={v}" for k, v in self.stats.items()))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._live(key, time.monotonic()) is not None
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, used, _ = entry
+        if (expires is not None and expires <= now) or (
+            self.idle_ttl is not None and used + self.idle_ttl <= now
+        ):
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        return entry
+
+    def lookup(self, key, default=None):
+        """Return the cached value for `key`, or `default`, counting a hit or miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            entry[1] = now
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, value, ttl=None):
+        """Store a value; `ttl` overrides the cache's default for this entry."""
+        now = time.monotonic()
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = [None if ttl is None else now + ttl, now, value]
+            self._entries.move_to_end(key)
+            while self.maxsize is not None and len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def expire(self):
+        """Drop every expired entry now rather than when it is next looked up."""
+        now = time.monotonic()
+        with self._lock:
+            for key in list(self._entries):
+                self._live(key, now)
+
+    def _claim(self, keys):
+        """Split keys into those this thread must fetch and futures to wait on."""
+        claimed, waiting = {}, {}
+        with self._lock:
+            for k in keys:
+                if k in self._inflight:
+                    waiting[k] = self._inflight[k]
+                else:
+                    claimed[k] = self._inflight[k] = Future()
+        return claimed, waiting
+
+    def _release(self, claimed):
+        with self._lock:
+            for k in claimed:
+                self._inflight.pop(k, None)
+
+    def _store(self, key, value):
+        if value is _ABSENT or not value:
+            if self.negative_ttl is not None:
+                self.set(key, value, ttl=self.negative_ttl)
+        else:
+            self.set(key, value)
+
+    def get(self, key, fetcher):
+        """Return the cached value, or `fetcher(key)` which is cached if truthy."""
+        result = self.lookup(key, _MISSING)
+        if result is not _MISSING:
+            return result
+        claimed, waiting = self._claim([key])
+        if waiting:
+            return waiting[key].result()
+        try:
+            result = fetcher(key)
+            self._store(key, result)
+        except Exception as e:
+            claimed[key].set_exception(e)
+            raise
+        finally:
+            self._release(claimed)
+        claimed[key].set_result(result)
+        return result
+
+    def get_dict(self, keys, fetcher):
+        """Return {key: value} for `keys`, calling `fetcher(missing_keys)` once.
+
+        `fetcher` returns a dict; keys it leaves out are absent from the
+        result too.
+        """
+        missing = []
+        result = {}
+        for k in set(keys):
+            value = self.lookup(k, _MISSING)
+            if value is _MISSING:
+                missing.append(k)
+            elif value is not _ABSENT:
+                result[k] = value
+        claimed, waiting = self._claim(missing)
+        try:
+            fetched = fetcher(list(claimed)) if claimed else {}
+            for k in claimed:
+                self._store(k, fetched.get(k, _ABSENT))
+        except Exception as e:
+            for future in claimed.values():
+                future.set_exception(e)
+            raise
+        finally:
+            self._release(claimed)
+        for k, future in claimed.items():
+            future.set_result(fetched.get(k, _ABSENT))
+        result.update(fetched)
+        for k, future in waiting.items():
+            value = future.result()
+            if value is not _ABSENT:
+                result[k] = value
+        return result
+
+
+class _TaggedEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return {"__datetime__": obj.isoformat()}
+        return super().default(obj)
+
+
+def _decode_tagged(obj):
+    if len(obj) == 1 and "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+class DiskCache:
+    """Thread-safe SQLite cache of JSON values that never change once stored.
+
+    Meant for immutable resources such as ECS task definition revisions, so a
+    restarted process starts warm instead of describing everything again.
+    datetimes are tagged on the way in and come back as datetimes.
+
+    Args:
+        path (str): Database file; ":memory:" keeps it in process.
+        cacheable (callable, optional): Keys for which this returns false are
+            always fetched and never stored, e.g. names of mutable resources.
+
+    """
+
+    def __init__(self, path, cacheable=None):
+        self.path = path
+        self.cacheable = cacheable
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+    @property
+    def stats(self):
+        return {
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": None if self.hit_rate is None else round(self.hit_rate, 3),
+        }
+
+    def __repr__(self):
+        return "DiskCache<{}>".format(
+            " ".join(f"{k}={v}" for k, v in self.stats.items())
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def lookup(self, key, default=None):
+        """Return the stored value for `key`, or `default`, counting a hit or miss."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return json.loads(row[0], object_hook=_decode_tagged)
+
+    def set(self, key, value):
+        """Store a JSON-serializable value, which may contain datetimes."""
+        encoded = json.dumps(value, cls=_TaggedEncoder)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?)", (key, encoded)
+            )
+
+    def get(self, key, fetcher):
+        """Return the stored value, or `fetcher(key)` which is stored if truthy."""
+        if self.cacheable and not self.cacheable(key):
+            return fetcher(key)
+        value = self.lookup(key, _MISSING)
+        if value is _MISSING:
+            value = fetcher(key)
+            if value:
+                self.set(key, value)
+        return value
+
+    def close(self):
+        self._db.close()
+
+
+# "family:revision" or a full task-definition ARN ending in one; a bare family
+# name resolves to whichever revision is latest.
+_TASK_DEFINITION_REVISION = re.compile(r"(^|/)[A-Za-z0-9_-]+:[0-9]+$")
+
+
+def task_definition_store(path):
+    """DiskCache of ECS task definitions keyed by revisioned ARN."""
+    return DiskCache(path, cacheable=_TASK_DEFINITION_REVISION.search)
@@ -1,15 +1,69 @@
+import functools
+import json
 import re
 import shlex
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from utils.cache import Cache
 from utils.exceptions import GraphQLError, InvalidTaxonomyURI
 
+POOL_SIZE = 16
+RESPONSE_CACHE_SIZE = 1024
 
-def query_graphql(raw_query, endpoint):
-    """Query a graphql API handle errors."""
-    query = " ".join(shlex.split(raw_query, posix=False))
-    r = requests.get(endpoint, params={"query": query})
+_session = None
+_session_lock = threading.Lock()
+_responses = Cache(maxsize=RESPONSE_CACHE_SIZE)
+
+
+def get_session():
+    """Shared requests Session with keep-alive connections and retries."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=3, backoff_factor=0.2, status_forcelist=(502, 503, 504))
+            adapter = HTTPAdapter(
+                pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry
+            )
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_query(raw_query):
+    """Collapse whitespace outside quoted strings."""
+    return " ".join(shlex.split(raw_query, posix=False))
+
+
+def clear_cache():
+    _responses.clear()
+
+
+def query_graphql(raw_query, endpoint, cache_ttl=None):
+    """Query a graphql API handle errors.
+
+    Args:
+        raw_query (str): Query; whitespace is normalized before sending.
+        endpoint (str): GraphQL URL.
+        cache_ttl (int, optional): Reuse a successful response to the same
+            normalized query for this many seconds.
+
+    """
+    query = normalize_query(raw_query)
+    if cache_ttl:
+        content = _responses.lookup((endpoint, query))
+        if content is not None:
+            # Parse per hit so callers never share (and mutate) a cached response.
+            return json.loads(content)
+    r = get_session().get(endpoint, params={"query": query})
     if r.status_code == 200:
+        if cache_ttl:
+            _responses.set((endpoint, query), r.content, ttl=cache_ttl)
         return r.json()
     elif r.status_code == 400:
         response = r.json()
@@ -19,3 +73,16 @@ def query_graphql(raw_query, endpoint):
         raise requests.exceptions.RequestException(
             f"HTTP Status: {r.status_code}, Response Body: {r.text}"
         )
+
+
+def query_graphql_many(raw_queries, endpoint, max_workers=8, cache_ttl=None):
+    """Run several queries concurrently, returning their responses in order.
+
+    The first GraphQLError or RequestException is raised.
+    """
+    with ThreadPoolExecutor(max_workers=min(max_workers, POOL_SIZE)) as executor:
+        return list(
+            executor.map(
+                lambda q: query_graphql(q, endpoint, cache_ttl=cache_ttl), raw_queries
+            )
+        )
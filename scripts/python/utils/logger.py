@@ -1,25 +1,129 @@
+import atexit
+import collections
+import functools
+import json
 import logging
+import os
+import queue
+import threading
 import time
 from contextlib import ContextDecorator
+from datetime import datetime, timezone
 
 import structlog
-from structlog import PrintLogger, wrap_logger
-from structlog.processors import JSONRenderer, TimeStamper
+
+MAX_EVENTS = 1000
+SUB_BUCKETS = 16  # per power of two, so bucket bounds are within ~6% of a value
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+# json.dumps builds a new encoder per call when given options; reuse one.
+_encode = json.JSONEncoder(sort_keys=True, default=repr).encode
+
+
+@functools.lru_cache(maxsize=4)
+def _iso_second(second):
+    return datetime.fromtimestamp(second, timezone.utc).isoformat()[:19]
+
+
+def _timestamp(now):
+    """ISO 8601 UTC like TimeStamper(fmt="iso"), formatting each second only once."""
+    second = int(now)
+    micros = round((now - second) * 1e6)
+    if micros == 0:
+        return f"{_iso_second(second)}Z"
+    if micros == 1000000:
+        return f"{_iso_second(second + 1)}Z"
+    return f"{_iso_second(second)}.{micros:06d}Z"
+
+
+def _render(context, prefix, event, level, now, kwargs):
+    """Render an event as a JSON line, reusing the pre-rendered bound context.
+
+    Context keys come first, then the event's own keys, each sorted. If the
+    event overrides a bound key the whole line is rendered instead.
+    """
+    fields = {**kwargs, "event": event, "level": level, "timestamp": _timestamp(now)}
+    if not prefix:
+        return _encode(fields)
+    if not context.keys().isdisjoint(fields):
+        return _encode({**context, **fields})
+    return "{" + prefix + ", " + _encode(fields)[1:]
+
+
+class BackgroundWriter:
+    """Render and write log lines on a worker thread instead of the caller's.
+
+    Args:
+        sink (callable): Receives each rendered line.
+
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if isinstance(record, threading.Event):
+                record.set()
+                continue
+            try:
+                self.sink(_render(*record))
+            except Exception:
+                logging.getLogger().exception("BackgroundWriter failed to write")
+
+    def put(self, record):
+        self._queue.put(record)
+
+    def flush(self):
+        """Block until every event queued so far has been written."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
 
 
 class Logger:
-    def __init__(self, level=logging.INFO, **kwargs):
-        self._logger = wrap_logger(
-            structlog.get_logger(),
-            processors=[TimeStamper(fmt="iso"), JSONRenderer(sort_keys=True)],
-        )
+    """JSON lines logger with bound context.
+
+    Bound context is rendered once when it is bound, so each event only
+    renders its own fields; lines hold the context keys first, then the
+    event's. Events below `level` return before any work.
+
+    Args:
+        level (int): Minimum level to log.
+        sink (callable, optional): Receives each rendered line; defaults to
+            structlog's configured logger.
+        background (bool): Render and write on a worker thread. Values passed
+            to `log` must not be mutated afterwards.
+        max_events (int): Events kept in `events` when `persist` is on.
+        **kwargs: Context to bind.
+
+    """
+
+    def __init__(
+        self,
+        level=logging.INFO,
+        sink=None,
+        background=False,
+        max_events=MAX_EVENTS,
+        **kwargs,
+    ):
+        self.sink = sink if sink else structlog.get_logger().msg
+        self._writer = BackgroundWriter(self.sink) if background else None
+        self._context = {}
+        self._prefix = ""
         self.level = level
         self.bind(**kwargs)
-        self.events = []
+        self.events = collections.deque(maxlen=max_events)
         self.persist = False
 
     def bind(self, **kwargs):
-        """Bind context data to logger by forwarding to structlog.
+        """Bind context data to the logger and pre-render it.
 
         Args:
             **kwargs: keyword arguments/context dict
@@ -28,11 +132,12 @@ class Logger:
             self
 
         """
-        self._logger = self._logger.bind(**kwargs)
+        self._context = {**self._context, **kwargs}
+        self._prefix = _encode(self._context)[1:-1]
         return self
 
     def unbind(self, *keys):
-        """Unbind context data from logger by forwarding to structlog.
+        """Unbind context data from logger.
 
         Args:
             *keys: list of keys to unbind
@@ -41,21 +146,36 @@ class Logger:
             None
 
         """
-        self._logger = self._logger.unbind(*keys)
+        self._context = {k: v for k, v in self._context.items() if k not in keys}
+        self._prefix = _encode(self._context)[1:-1]
         return self
 
-    def _log(self, event, **kwargs):
-        return self._logger.msg(event, **kwargs)
+    def _log(self, event, level, kwargs):
+        record = (self._context, self._prefix, event, level, time.time(), kwargs)
+        if self._writer:
+            self._writer.put(record)
+            return
+        line = _render(*record)
+        self.sink(line)
+        return line
+
+    def flush(self):
+        """Wait for a background logger to write everything queued so far."""
+        if self._writer:
+            self._writer.flush()
 
-    def context(self, action=None, bind=None):
+    def context(self, action=None, bind=None, emit=True):
         """
         Return a LoggerContext that saves+restores state, optionally with binding, and duration logging.
 
         Args:
             action (str): if provided, a start log will be made on entry, and finish log with duration on exit
             bind (dict): if provided, these values will be bound to the logger while the context is active
+            emit (bool): if False, skip the start/finish logs and only record the duration in `timings`
         """
-        return LoggerContext(self, action, bind, level=self.level)
+        return LoggerContext(
+            self, action, bind, level=self.level, emit=emit, timings=timings
+        )
 
     def log(self, event, level=logging.INFO, **kwargs):
         """Log an event to the logger. Records log level as a context variable.
@@ -66,20 +186,17 @@ class Logger:
             kwargs: arbitrary key value pairs
 
         Returns:
-            log data
+            the rendered log line, or None when filtered or logging in the background
 
         """
         if level < self.level:
             return
         else:
             if self.persist:
-                event = {
-                    "level": level,
-                    "event": event,
-                    "context": self._logger._context,
-                }
-                self.events.append(event)
-            return self._log(event, level=level, **kwargs)
+                self.events.append(
+                    {"level": level, "event": event, "context": self._context}
+                )
+            return self._log(event, level, kwargs)
 
     def debug(self, event, **kwargs):
         return self.log(event, level=logging.DEBUG, **kwargs)
@@ -97,38 +214,192 @@ class Logger:
         return self.log(event, level=logging.CRITICAL, **kwargs)
 
 
+class Histogram:
+    """Log-linear (HDR-style) histogram of durations with microsecond resolution.
+
+    Each power of two is split into SUB_BUCKETS equal buckets, so memory stays
+    small and percentiles are accurate to a few percent.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.buckets = collections.Counter()
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def _bucket(micros):
+        exponent = max(micros.bit_length() - 5, 0)  # 2**4 == SUB_BUCKETS
+        return exponent, micros >> exponent
+
+    @staticmethod
+    def _value(bucket):
+        exponent, sub = bucket
+        return ((sub << exponent) + (1 << exponent) / 2) / 1e6
+
+    def record(self, seconds):
+        bucket = self._bucket(int(seconds * 1e6))
+        with self._lock:
+            self.buckets[bucket] += 1
+            self.count += 1
+            self.sum += seconds
+            if self.min is None or seconds < self.min:
+                self.min = seconds
+            if self.max is None or seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, q):
+        """Approximate duration below which a fraction `q` of records fall."""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for bucket in sorted(self.buckets):
+                seen += self.buckets[bucket]
+                if seen >= rank:
+                    return min(max(self._value(bucket), self.min), self.max)
+
+    def snapshot(self, quantiles=QUANTILES):
+        summary = {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+        }
+        summary.update((f"p{q * 100:g}", self.percentile(q)) for q in quantiles)
+        return summary
+
+
+class Timings:
+    """Registry of per-action Histograms fed by LoggerContext.
+
+    Flush periodically with `start`, or call `log` / `write_prometheus`
+    directly.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self._stop = None
+
+    def record(self, action, seconds):
+        histogram = self.histograms.get(action)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(action, Histogram())
+        histogram.record(seconds)
+
+    def snapshot(self, reset=False):
+        """Return {action: summary}, optionally starting a new interval."""
+        with self._lock:
+            histograms = list(self.histograms.items())
+        summaries = {}
+        for action, histogram in histograms:
+            summaries[action] = histogram.snapshot()
+            if reset:
+                with histogram._lock:
+                    histogram.reset()
+        return summaries
+
+    def log(self, logger, reset=True):
+        """Log one "timings" line per action that has records."""
+        for action, summary in self.snapshot(reset=reset).items():
+            if summary["count"]:
+                logger.info("timings", action=action, **summary)
+
+    def write_prometheus(self, path, name="action_duration_seconds"):
+        """Write cumulative summaries in the Prometheus text format.
+
+        The file is replaced atomically, e.g. for node_exporter's textfile
+        collector.
+        """
+        lines = [f"# TYPE {name} summary"]
+        for action, summary in self.snapshot().items():
+            label = (
+                action.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            )
+            for q in QUANTILES:
+                value = summary[f"p{q * 100:g}"]
+                value = "NaN" if value is None else value
+                lines.append(f'{name}{{action="{label}",quantile="{q}"}} {value}')
+            lines.append(f'{name}_sum{{action="{label}"}} {summary["sum"]}')
+            lines.append(f'{name}_count{{action="{label}"}} {summary["count"]}')
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+    def start(self, interval=60, logger=None, path=None):
+        """Flush every `interval` seconds to `logger`, a Prometheus file at `path`, or both."""
+        self.stop()
+        self._stop = stop = threading.Event()
+
+        def _flush():
+            while not stop.wait(interval):
+                if path:
+                    self.write_prometheus(path)
+                if logger:
+                    # Prometheus summaries are cumulative, so only reset without one.
+                    self.log(logger, reset=not path)
+
+        threading.Thread(target=_flush, daemon=True).start()
+
+    def stop(self):
+        if self._stop:
+            self._stop.set()
+            self._stop = None
+
+
+timings = Timings()
+
+
 class LoggerContext(ContextDecorator):
     """
     Context manager which saves+restores a logger's state, and optionally binds, and logs start+finish with duration.
 
     """
 
-    def __init__(self, log, action=None, bind=None, level=logging.INFO):
+    def __init__(
+        self, log, action=None, bind=None, level=logging.INFO, emit=True, timings=None
+    ):
         self.action = action
         self.bind = bind
         self.log = log
         self.level = level
-        self.initial_log_logger = None
+        self.emit = emit
+        self.timings = timings
+        self.initial_state = None
         self.start = None
         self.on_the_fly = {}
 
     def __enter__(self):
         """Enter and record the logger's original state"""
         self.start = time.time()
-        self.initial_log_logger = self.log._logger
+        self.initial_state = (self.log._context, self.log._prefix)
         if self.bind:
             self.log.bind(**self.bind)
-        if self.action:
+        if self.action and self.emit:
             self.log.log("start:%s" % self.action, level=self.level)
         return self.on_the_fly
 
     def __exit__(self, *exc):
         """Exit and return the logger to its original state"""
         now = time.time()
-        if self.action:
-            self.log.bind(duration=now - self.start)
-            self.log.bind(**self.on_the_fly)
-            self.log.log("finish:%s" % self.action, level=self.level)
-        self.log._logger = self.initial_log_logger
-        self.initial_log_logger = None
-        self.start = None
+        try:
+            if self.action:
+                if self.timings is not None:
+                    self.timings.record(self.action, now - self.start)
+                if self.emit:
+                    self.log.bind(duration=now - self.start)
+                    self.log.bind(**self.on_the_fly)
+                    self.log.log("finish:%s" % self.action, level=self.level)
+        finally:
+            self.log._context, self.log._prefix = self.initial_state
+            self.initial_state = None
+            self.start = None